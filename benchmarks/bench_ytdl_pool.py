@@ -0,0 +1,68 @@
+"""Per-request overhead of fresh YoutubeDL instances vs the pool, on a fake local extractor.
+
+Run from the repo root: python benchmarks/bench_ytdl_pool.py [requests]
+No network is used - the extractor returns a canned result, so the numbers
+are the option parsing / extractor setup / instance overhead alone.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from config import *
+from ytdl_pool import *
+
+class FakeIE(InfoExtractor):
+    IE_NAME = 'Fake'
+    _VALID_URL = r'fake://(?P<id>\w+)'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return {
+            'id': video_id,
+            'title': f'Fake video {video_id}',
+            'duration': 60,
+            'formats': [
+                {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a'},
+                {'format_id': '140', 'url': 'http://127.0.0.1/140.m4a', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 128},
+            ],
+        }
+
+def extract(ydl, i):
+    if 'Fake' not in ydl._ies:
+        ydl.add_info_extractor(FakeIE())
+    return ydl.extract_info(f'fake://video{i}', download=False, ie_key='Fake')
+
+def fresh(i):
+    # What every handler did before the pool: build, use and drop an instance
+    with yt_dlp.YoutubeDL(dict(YTDL_INFO_OPTIONS)) as ydl:
+        ydl.get_info_extractor('Youtube')
+        return extract(ydl, i)
+
+def pooled(pool, i):
+    with pool.instance('info') as ydl:
+        return extract(ydl, i)
+
+def measure(label, func, requests):
+    func(0)  # warm imports and lazy extractors
+    start = time.perf_counter()
+    for i in range(requests):
+        func(i)
+    per_request = (time.perf_counter() - start) / requests * 1000
+    print(f"{label:<8} {per_request:8.1f} ms/request")
+    return per_request
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pool = YoutubeDLPool()
+    pool.prewarm()
+
+    fresh_ms = measure("fresh", fresh, requests)
+    pooled_ms = measure("pooled", lambda i: pooled(pool, i), requests)
+    print(f"saved    {fresh_ms - pooled_ms:8.1f} ms/request ({fresh_ms / pooled_ms:.1f}x)")
+
+if __name__ == "__main__":
+    main()
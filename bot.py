@@ -2,21 +2,57 @@ import asyncio
 import re
 import os
 from datetime import datetime
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-import yt_dlp
 from motor.motor_asyncio import AsyncIOMotorClient
 from config import *
 from utils import *
+from jobs import *
+from predictor import *
+from scheduler import *
+from sessions import *
+from inflight import *
+from resilience import *
+from retention import *
+from logs import *
+
+log = get_logger("bot")
 
 # Initialize bot
 app = Client("yt_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
 
+# Upload sessions: the bot itself plus any extra upload-only bots
+upload_pool.set_primary(app)
+if UPLOAD_BOT_TOKENS and not UPLOAD_CHANNEL_ID:
+    log.warning("upload_sessions_disabled", reason="UPLOAD_BOT_TOKENS needs UPLOAD_CHANNEL_ID")
+elif UPLOAD_CHANNEL_ID:
+    for i, token in enumerate(UPLOAD_BOT_TOKENS, start=1):
+        upload_pool.add(
+            f"uploader_{i}",
+            Client(f"yt_bot_uploader_{i}", api_id=API_ID, api_hash=API_HASH, bot_token=token, no_updates=True)
+        )
+
 # MongoDB setup
 mongo_client = AsyncIOMotorClient(MONGO_URL)
 db = mongo_client.ytbot
 users_col = db.users
 downloads_col = db.downloads
+jobs_col = db.jobs
+throughput_col = db.throughput
+summaries_col = db.download_summaries
+metrics_col = db.metrics
+
+# Audio derived from cached downloads is counted here
+media_cache.attach_metrics(metrics_col)
+
+# Download history retention
+retention = DownloadRetention(downloads_col, summaries_col)
+
+# Job journal setup
+if JOB_JOURNAL_BACKEND == "mongo":
+    journal = JobJournal(MongoJobStore(jobs_col))
+else:
+    journal = JobJournal(LocalJobStore(JOB_JOURNAL_PATH))
 
 # Start command
 @app.on_message(filters.command("start"))
@@ -39,10 +75,12 @@ async def start_handler(client, message):
 • Download videos in all qualities (240p → 2160p60)
 • Audio formats: MP3, M4A, Opus
 • Direct Telegram file delivery
+• Clip just the part you need
 • Fast & secure downloads
 
 📝 **How to use:**
 Just send me any YouTube link and I'll handle the rest!
+Want only a part? Add a time range: `link 1:20-1:50`
 
 ⚡ **Supported:** YouTube, YouTube Music, YouTube Shorts
 📊 **File Limit:** Up to 2GB per file
@@ -56,129 +94,297 @@ Just send me any YouTube link and I'll handle the rest!
         ])
     )
 
+async def analyze_video(url):
+    """Extract title and downloadable formats of one video"""
+    info = await extract_info(url)
+    
+    title = info.get('title', 'Unknown Title')[:50]
+    duration = info.get('duration') or 0
+    uploader = info.get('uploader', 'Unknown')
+    
+    # Format duration
+    duration_str = f"{duration//60}:{duration%60:02d}" if duration else "Unknown"
+    
+    # Get available formats
+    formats = info.get('formats', [])
+    video_formats = []
+    audio_formats = []
+    audio_specs = {}  # format_id -> what a locally derived copy must match
+    
+    # Video formats
+    for f in formats:
+        if f.get('vcodec') != 'none' and f.get('height'):
+            height = f.get('height')
+            fps = f.get('fps', 30)
+            filesize = estimate_format_size(f, duration)
+            
+            # Formats over the 2GB limit are kept - a clip of them may still fit
+            if height >= 240:
+                format_note = f"{height}p{fps}" if fps > 30 else f"{height}p"
+                
+                if not any(vf[1] == format_note for vf in video_formats):
+                    video_formats.append((f['format_id'], format_note, filesize))
+    
+    # Audio formats
+    for f in formats:
+        if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
+            ext = f.get('ext', 'unknown')
+            abr = f.get('abr', 128)
+            filesize = estimate_format_size(f, duration)
+            
+            if ext in ['mp3', 'm4a', 'opus']:
+                audio_formats.append((f['format_id'], f"{ext.upper()} {int(abr)}kbps", filesize))
+                audio_specs[f['format_id']] = {'ext': ext, 'abr': int(abr)}
+    
+    # Sort formats
+    video_formats.sort(key=lambda x: int(x[1].split('p')[0]), reverse=True)
+    audio_formats = audio_formats[:3]  # Top 3 audio formats
+    
+    return {
+        'url': url,
+        'title': title,
+        'uploader': uploader,
+        'duration': duration,
+        'duration_str': duration_str,
+        'video_formats': video_formats,
+        'audio_formats': audio_formats,
+        'audio_specs': audio_specs,
+        'clip': None,
+    }
+
+def set_clip(video, clip):
+    """Limit a video to a (start, end) range in seconds; False if it starts past the end"""
+    start, end = clip
+    duration = video.get('duration') or 0
+    if duration and start >= duration:
+        return False
+    video['clip'] = (start, min(end, duration) if duration else end)
+    return True
+
+def clip_size(video, size):
+    """Predicted size of a format, scaled down to the video's clip if it has one"""
+    clip = video.get('clip')
+    if not clip or not size or not video.get('duration'):
+        return size
+    return int(size * (clip[1] - clip[0]) / video['duration'])
+
+def available_formats(video, format_type):
+    """(index, format) pairs that fit Telegram's limit for this video or its clip"""
+    formats = video['video_formats'] if format_type == 'video' else video['audio_formats']
+    return [(i, f) for i, f in enumerate(formats) if clip_size(video, f[2]) <= MAX_FILE_SIZE]
+
+def video_title(video):
+    """Title of a video, with the clip range if only a part is wanted"""
+    if not video.get('clip'):
+        return video['title']
+    start, end = video['clip']
+    return f"{video['title']} [{format_timestamp(start)}-{format_timestamp(end)}]"
+
+def format_size_label(size):
+    return f" ({size//1024//1024}MB)" if size > 0 else ""
+
+def build_format_keyboard(video, video_index):
+    """Format selection buttons for one video"""
+    keyboard = []
+    
+    # Video buttons (2 per row)
+    video_row = []
+    for i, (format_id, format_name, size) in available_formats(video, 'video')[:8]:
+        size = clip_size(video, size)
+        video_row.append(InlineKeyboardButton(
+            f"🎥 {format_name}{format_size_label(size)}{format_eta_label(size)}", 
+            callback_data=f"dl_video_{format_id}_{i}_{video_index}"
+        ))
+        if len(video_row) == 2:
+            keyboard.append(video_row)
+            video_row = []
+    if video_row:
+        keyboard.append(video_row)
+    
+    # Audio buttons
+    audio_row = []
+    for i, (format_id, format_name, size) in available_formats(video, 'audio'):
+        size = clip_size(video, size)
+        audio_row.append(InlineKeyboardButton(
+            f"🎵 {format_name}{format_size_label(size)}{format_eta_label(size)}",
+            callback_data=f"dl_audio_{format_id}_{i}_{video_index}"
+        ))
+    if audio_row:
+        keyboard.append(audio_row)
+    
+    # Download only part of the video
+    keyboard.append([InlineKeyboardButton(
+        "✂️ Change clip" if video.get('clip') else "✂️ Clip a part",
+        callback_data=f"clip_{video_index}"
+    )])
+    
+    return keyboard
+
+def format_video_info(video):
+    """Format selection text for one video"""
+    clip_text = ""
+    if video.get('clip'):
+        start, end = video['clip']
+        clip_text = f"✂️ **Clip:** {format_timestamp(start)} - {format_timestamp(end)} ({format_eta(end - start)})\n"
+    
+    return f"""
+🎥 **{video['title']}**
+
+👤 **Channel:** {video['uploader']}
+⏱️ **Duration:** {video['duration_str']}
+{clip_text}
+📊 **Available Formats:**
+📹 **Video:** {len(available_formats(video, 'video')[:8])} qualities
+🎵 **Audio:** {len(available_formats(video, 'audio'))} formats
+
+🔽 **Select format to download:**
+"""
+
 # YouTube URL handler
-@app.on_message(filters.regex(r'(?:https?://)(?:www\.)?(?:youtube\.com/(?:[^/]+/.+/|(?:v|e(?:mbed)?)/|.*[?&]v=)|youtu\.be/)([^"&?/\s]{11})'))
+@app.on_message(filters.regex(YOUTUBE_URL_REGEX))
+@traced
 async def url_handler(client, message):
-    url = message.text.strip()
     user_id = message.from_user.id
+    text = message.text or message.caption
+    video_ids = extract_video_ids(text)[:MAX_LINKS_PER_MESSAGE]
+    clips = extract_clip_ranges(text)
+    
+    # YouTube is throttling us - turn new requests away instead of adding to the pile
+    if youtube_breaker.is_open():
+        log.info("analyze_shed", user_id=user_id, retry_after=int(youtube_breaker.retry_after()))
+        await message.reply_text(
+            f"{ERROR_MESSAGES['rate_limit']}\n⏳ Please try again in {breaker_eta()}."
+        )
+        return
     
     # Send processing message
-    process_msg = await message.reply_text("🔍 **Analyzing video...**\n⏳ Please wait...")
+    if len(video_ids) > 1:
+        process_msg = await message.reply_text(f"🔍 **Analyzing {len(video_ids)} videos...**\n⏳ Please wait...")
+    else:
+        process_msg = await message.reply_text("🔍 **Analyzing video...**\n⏳ Please wait...")
     
     try:
-        # Extract video info
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-        title = info.get('title', 'Unknown Title')[:50]
-        duration = info.get('duration', 0)
-        thumbnail = info.get('thumbnail', '')
-        uploader = info.get('uploader', 'Unknown')
-        
-        # Format duration
-        duration_str = f"{duration//60}:{duration%60:02d}" if duration else "Unknown"
-        
-        # Get available formats
-        formats = info.get('formats', [])
-        video_formats = []
-        audio_formats = []
-        
-        # Video formats
-        for f in formats:
-            if f.get('vcodec') != 'none' and f.get('height'):
-                height = f.get('height')
-                fps = f.get('fps', 30)
-                filesize = f.get('filesize', 0)
-                
-                # Check file size limit (2GB = 2147483648 bytes)
-                if filesize and filesize > 2147483648:
-                    continue
-                    
-                if height >= 240:
-                    format_note = f"{height}p{fps}" if fps > 30 else f"{height}p"
-                    size_mb = f" ({filesize//1024//1024}MB)" if filesize > 0 else ""
-                    
-                    if not any(vf[1].split('(')[0].strip() == format_note for vf in video_formats):
-                        video_formats.append((f['format_id'], f"{format_note}{size_mb}", filesize))
-        
-        # Audio formats
-        for f in formats:
-            if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
-                ext = f.get('ext', 'unknown')
-                abr = f.get('abr', 128)
-                filesize = f.get('filesize', 0)
-                
-                # Check file size limit
-                if filesize and filesize > 2147483648:
-                    continue
-                    
-                if ext in ['mp3', 'm4a', 'opus']:
-                    size_mb = f" ({filesize//1024//1024}MB)" if filesize > 0 else ""
-                    audio_formats.append((f['format_id'], f"{ext.upper()} {int(abr)}kbps{size_mb}", filesize))
-        
-        # Sort formats
-        video_formats.sort(key=lambda x: int(x[1].split('p')[0]), reverse=True)
-        audio_formats = audio_formats[:3]  # Top 3 audio formats
-        
-        # Create keyboard
-        keyboard = []
-        
-        # Video buttons (2 per row)
-        video_row = []
-        for i, (format_id, format_name, size) in enumerate(video_formats[:8]):
-            video_row.append(InlineKeyboardButton(
-                f"🎥 {format_name}", 
-                callback_data=f"dl_video_{format_id}_{i}"
-            ))
-            if len(video_row) == 2:
-                keyboard.append(video_row)
-                video_row = []
-        if video_row:
-            keyboard.append(video_row)
+        # Analyze all links at once, a few at a time
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_EXTRACTIONS)
+        rejected_clips = []  # videos whose time range starts past their end
         
-        # Audio buttons
-        audio_row = []
-        for i, (format_id, format_name, size) in enumerate(audio_formats):
-            audio_row.append(InlineKeyboardButton(
-                f"🎵 {format_name}",
-                callback_data=f"dl_audio_{format_id}_{i}"
-            ))
-        if audio_row:
-            keyboard.append(audio_row)
+        async def analyze(video_id):
+            async with semaphore:
+                video = await analyze_video(video_url(video_id))
+            # 'url 1:20-1:50' - only that part is wanted
+            if video_id in clips and not set_clip(video, clips[video_id]):
+                rejected_clips.append(video)
+            return video
+        
+        results = await asyncio.gather(*(analyze(video_id) for video_id in video_ids), return_exceptions=True)
+        videos = [result for result in results if not isinstance(result, Exception)]
+        failed = len(results) - len(videos)
+        
+        if not videos:
+            raise results[0]
         
         # Store URL in callback data workaround
         app.temp_urls = getattr(app, 'temp_urls', {})
-        app.temp_urls[user_id] = {
-            'url': url,
-            'video_formats': video_formats,
-            'audio_formats': audio_formats,
-            'title': title
-        }
+        app.temp_urls[user_id] = {'videos': videos}
         
-        # Update message
-        video_info = f"""
-🎥 **{title}**
-
-👤 **Channel:** {uploader}
-⏱️ **Duration:** {duration_str}
-
-📊 **Available Formats:**
-📹 **Video:** {len(video_formats)} qualities
-🎵 **Audio:** {len(audio_formats)} formats
-
-🔽 **Select format to download:**
-"""
+        if len(videos) == 1:
+            if rejected_clips:
+                # Never offer the full video as if it were the clip - ask for another range
+                app.temp_urls[user_id]['clip_video'] = 0
+                await process_msg.edit_text(
+                    f"❌ The video is only {videos[0]['duration_str']} long. Please send another range."
+                )
+                return
+            await process_msg.edit_text(
+                format_video_info(videos[0]),
+                reply_markup=InlineKeyboardMarkup(build_format_keyboard(videos[0], 0))
+            )
+            return
+        
+        # Combined selection for several videos
+        videos_text = "\n".join(
+            f"{i + 1}. **{video_title(video)}** ({video['duration_str']})" for i, video in enumerate(videos)
+        )
+        failed_text = f"\n⚠️ {failed} link(s) could not be analyzed.\n" if failed else ""
+        failed_text += "".join(
+            f"\n⚠️ **{video['title']}** is only {video['duration_str']} long - its time range was ignored.\n"
+            for video in rejected_clips
+        )
+        
+        keyboard = [
+            [InlineKeyboardButton(f"🎬 {i + 1}. {video['title'][:30]}", callback_data=f"pick_{i}")]
+            for i, video in enumerate(videos)
+        ]
+        keyboard.append([
+            InlineKeyboardButton("📥 All - Best Video", callback_data="dl_all_video"),
+            InlineKeyboardButton("🎵 All - Best Audio", callback_data="dl_all_audio"),
+        ])
         
         await process_msg.edit_text(
-            video_info,
+            f"🎥 **{len(videos)} videos found**\n\n{videos_text}\n{failed_text}\n"
+            f"🔽 **Pick a video to choose its format, or download all:**",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
         
     except Exception as e:
-        await process_msg.edit_text(f"❌ **Error:** {str(e)}")
+        log.error("analyze_error", user_id=user_id, links=len(video_ids), error=str(e))
+        await process_msg.edit_text(user_error_message(e))
+
+def get_user_videos(user_id):
+    """Get the videos a user last sent, or None if the session expired"""
+    user_data = getattr(app, 'temp_urls', {}).get(user_id)
+    return user_data['videos'] if user_data else None
+
+# Pick one video from a multi-link message
+@app.on_callback_query(filters.regex(r"^pick_(\d+)$"))
+async def pick_callback(client, callback_query: CallbackQuery):
+    video_index = int(callback_query.data.split('_')[1])
+    videos = get_user_videos(callback_query.from_user.id)
+    
+    if not videos or video_index >= len(videos):
+        await callback_query.answer("❌ Session expired! Send YouTube link again.")
+        return
+    
+    video = videos[video_index]
+    await callback_query.answer()
+    await callback_query.message.reply_text(
+        format_video_info(video),
+        reply_markup=InlineKeyboardMarkup(build_format_keyboard(video, video_index))
+    )
+
+# Download all videos of a multi-link message
+@app.on_callback_query(filters.regex(r"^dl_all_(video|audio)$"))
+@traced
+async def download_all_callback(client, callback_query: CallbackQuery):
+    format_type = callback_query.data.split('_')[2]
+    user_id = callback_query.from_user.id
+    videos = get_user_videos(user_id)
+    
+    if not videos:
+        await callback_query.answer("❌ Session expired! Send YouTube link again.")
+        return
+    
+    await callback_query.answer(f"🚀 Starting {len(videos)} downloads...")
+    
+    downloads = []
+    for video in videos:
+        formats = available_formats(video, format_type)
+        if not formats:
+            await callback_query.message.reply_text(f"❌ **No {format_type} format available**\n🎬 **{video_title(video)}**")
+            continue
+        
+        # Formats are sorted best first
+        format_index, (format_id, _, _) = formats[0]
+        progress_msg = await callback_query.message.reply_text(
+            f"⏳ **Preparing download...**\n🎬 **{video_title(video)}**\n📥 Initializing..."
+        )
+        downloads.append(start_download(client, user_id, video, format_type, format_id, format_index, progress_msg))
+    
+    await asyncio.gather(*downloads)
 
 # Download callback handler
 @app.on_callback_query(filters.regex(r"dl_(video|audio)_(.+)_(\d+)"))
+@traced
 async def download_callback(client, callback_query: CallbackQuery):
     try:
         data = callback_query.data
@@ -186,31 +392,213 @@ async def download_callback(client, callback_query: CallbackQuery):
         format_type = parts[1]  # video or audio
         format_id = parts[2]
         format_index = int(parts[3])
+        video_index = int(parts[4]) if len(parts) > 4 else 0
         
         user_id = callback_query.from_user.id
         
         # Get stored URL and formats
-        if not hasattr(app, 'temp_urls') or user_id not in app.temp_urls:
+        videos = get_user_videos(user_id)
+        if not videos or video_index >= len(videos):
             await callback_query.answer("❌ Session expired! Send YouTube link again.")
             return
         
-        user_data = app.temp_urls[user_id]
-        url = user_data['url']
-        title = user_data['title']
+        video = videos[video_index]
         
         await callback_query.answer("🚀 Starting download...")
         
         # Edit message to show progress
         progress_msg = await callback_query.message.edit_text(
-            f"⏳ **Preparing download...**\n🎬 **{title}**\n📥 Initializing..."
+            f"⏳ **Preparing download...**\n🎬 **{video_title(video)}**\n📥 Initializing..."
         )
         
-        # Download and send file
-        success = await process_download_and_send(
-            client, url, format_id, format_type, progress_msg, user_id, title
-        )
+        await start_download(client, user_id, video, format_type, format_id, format_index, progress_msg)
+            
+    except Exception as e:
+        await callback_query.message.edit_text(user_error_message(e))
+
+# Ask which part of a video to download
+@app.on_callback_query(filters.regex(r"^clip_(\d+)$"))
+async def clip_callback(client, callback_query: CallbackQuery):
+    video_index = int(callback_query.data.split('_')[1])
+    user_id = callback_query.from_user.id
+    videos = get_user_videos(user_id)
+    
+    if not videos or video_index >= len(videos):
+        await callback_query.answer("❌ Session expired! Send YouTube link again.")
+        return
+    
+    # The next time range this user sends applies to this video
+    app.temp_urls[user_id]['clip_video'] = video_index
+    await callback_query.answer()
+    await callback_query.message.reply_text(
+        f"✂️ **Which part do you want?**\n🎬 **{videos[video_index]['title']}** ({videos[video_index]['duration_str']})\n\n"
+        f"Send the start and end time, e.g. `1:20-1:50`"
+    )
+
+# Time range sent after tapping the clip button
+@app.on_message(filters.regex(r"^\s*\d+(:\d+){0,2}\s*-\s*\d+(:\d+){0,2}\s*$"))
+async def clip_range_handler(client, message):
+    user_id = message.from_user.id
+    user_data = getattr(app, 'temp_urls', {}).get(user_id)
+    
+    if not user_data or 'clip_video' not in user_data:
+        await message.reply_text("✂️ Send a YouTube link first, then tap **Clip a part** - or send `link 1:20-1:50`.")
+        return
+    
+    video_index = user_data['clip_video']
+    video = user_data['videos'][video_index]
+    
+    if not TIME_RANGE_REGEX.fullmatch(message.text.strip()):
+        await message.reply_text("❌ Invalid time - minutes and seconds go up to 59, e.g. `1:20-1:50`.")
+        return
+    clip = parse_time_range(message.text)
+    if not clip:
+        await message.reply_text("❌ The end time must be after the start time, e.g. `1:20-1:50`.")
+        return
+    if not set_clip(video, clip):
+        await message.reply_text(f"❌ The video is only {video['duration_str']} long. Please send another range.")
+        return
+    
+    del user_data['clip_video']
+    await message.reply_text(
+        format_video_info(video),
+        reply_markup=InlineKeyboardMarkup(build_format_keyboard(video, video_index))
+    )
+
+async def start_download(client, user_id, video, format_type, format_id, format_index, progress_msg):
+    """Create a job for the chosen format (or join an identical one), then download and send it"""
+    try:
+        url = video['url']
+        title = video_title(video)
+        clip = video.get('clip')
+        
+        key = job_key(url, format_id, format_type, clip)
+        entry = inflight.get(key)
+        
+        if entry and user_id in entry.subscribers:
+            await update_progress_message(progress_msg, f"⏳ **Already downloading this for you...**\n🎬 **{title}**")
+            return
+        
+        if entry:
+            # Same video and format is already on its way - share it instead of downloading again
+            result = entry.attach(user_id, progress_msg)
+            await save_subscribers(entry)
+            log.info("job_joined", job_id=entry.job['job_id'], user_id=user_id, subscribers=len(entry.subscribers))
+            await progress_msg.edit_text(
+                f"🤝 **Joined an identical download in progress**\n🎬 **{title}**\n\n{entry.last_text or ''}",
+                reply_markup=entry.reply_markup
+            )
+        else:
+            # Predicted size of the chosen format (0 if unknown)
+            formats = video['video_formats'] if format_type == 'video' else video['audio_formats']
+            expected_size = clip_size(video, formats[format_index][2]) if format_index < len(formats) else 0
+            
+            # Record the job so it can be resumed after a restart
+            audio = video['audio_specs'].get(format_id) if format_type == 'audio' else None
+            job = await journal.create(user_id, url, format_id, format_type, title, expected_size, clip, audio)
+            log.info(
+                "job_created", job_id=job['job_id'], user_id=user_id, url=url,
+                format_id=format_id, format_type=format_type, clip=clip
+            )
+            
+            # Everything the job does from here on is traced by its ID
+            with trace(job['job_id']):
+                entry = inflight.start(key, job, lambda entry: run_shared_job(client, entry), cancel_markup(job))
+            result = entry.attach(user_id, progress_msg)
+            await save_subscribers(entry)
         
-        if success:
+        with trace(entry.job['job_id']):
+            await deliver_shared_job(user_id, progress_msg, entry, result)
+        
+    except Exception as e:
+        log.error("start_download_error", user_id=user_id, error=str(e))
+        await update_progress_message(progress_msg, user_error_message(e))
+
+def job_key(url, format_id, format_type, clip=None):
+    """Jobs with the same key produce the same file and can be shared"""
+    return (extract_video_id(url) or url, format_id, format_type, tuple(clip) if clip else None)
+
+async def save_subscribers(entry):
+    """Journal who waits for a job and who the file goes to, so a restart doesn't lose them"""
+    job = entry.job
+    if job['state'] in FINISHED_STATES:
+        return
+    await journal.transition(job, job['state'], user_id=job['user_id'], subscribers=entry.subscriber_records())
+
+def cancel_markup(job):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{job['job_id']}")]])
+
+async def run_shared_job(client, entry):
+    """Run a job once for everyone attached to it"""
+    job = entry.job
+    try:
+        return await run_scheduled_job(client, job, entry)
+    except asyncio.CancelledError:
+        # Every requester cancelled
+        await journal.transition(job, JOB_CANCELLED)
+        remove_scratch_dir(job)
+        raise
+
+async def deliver_shared_job(user_id, progress_msg, entry, result):
+    """Wait for a (possibly shared) job and make sure this user gets the file"""
+    message = await result
+    if message is None:
+        # This user cancelled - the job carries on for anyone else
+        return
+    
+    job = entry.job
+    # job['user_id'] changes when the target cancels, so check where the file actually went
+    if message and message.chat.id != user_id:
+        # The file was uploaded for someone else - re-send it without downloading or uploading again
+        try:
+            message = await message.copy(user_id)
+        except Exception as e:
+            log.error("shared_delivery_error", user_id=user_id, error=str(e))
+            message = False
+    
+    await finish_download(progress_msg, user_id, job['url'], job['format_id'], job['format_type'], job['title'], message)
+
+def breaker_eta():
+    """When YouTube throttling should let work through again, for messages to users"""
+    seconds = youtube_breaker.retry_after()
+    # A probe is checking whether YouTube recovered - that takes seconds, not a cooldown
+    return f"~{format_eta(seconds)}" if seconds >= 5 else "a moment"
+
+def format_eta_label(size):
+    """Predicted time-to-delivery suffix for a format button"""
+    eta = throughput.predict_delivery_seconds(size)
+    return f" ~{format_eta(eta)}" if eta else ""
+
+async def run_scheduled_job(client, job, progress_msg):
+    """Wait for a job slot (short jobs first), then download and send"""
+    predicted = throughput.predict_delivery_seconds(job.get('expected_size') or 0)
+    
+    # YouTube is throttling us - hold the job until the breaker lets work through
+    if youtube_breaker.is_open():
+        await update_progress_message(
+            progress_msg,
+            f"⏸️ **YouTube is rate-limiting us**\n🎬 **{job['title']}**\n"
+            f"⏳ Your download will start automatically in {breaker_eta()}."
+        )
+        await youtube_breaker.wait_until_closed()
+    
+    if scheduler.is_busy():
+        await update_progress_message(
+            progress_msg,
+            f"🕒 **Queued...**\n🎬 **{job['title']}**\n"
+            f"👥 {scheduler.queue_length() + 1} job(s) waiting - starting soon!"
+        )
+    
+    async with scheduler.slot(predicted):
+        return await process_download_and_send(
+            client, job['url'], job['format_id'], job['format_type'],
+            progress_msg, job['user_id'], job['title'], journal, job, job.get('clip'), job.get('audio')
+        )
+
+async def finish_download(progress_msg, user_id, url, format_id, format_type, title, success):
+    """Log a finished download and show the result to the user"""
+    if success:
+        with log.timed("db_record", user_id=user_id):
             # Log download
             await downloads_col.insert_one({
                 "user_id": user_id,
@@ -226,44 +614,117 @@ async def download_callback(client, callback_query: CallbackQuery):
                 {"user_id": user_id},
                 {"$inc": {"download_count": 1}}
             )
-            
-            # Send completion message
-            await progress_msg.edit_text(
-                f"✅ **Download Completed!**\n\n"
-                f"🎬 **{title}**\n"
-                f"📱 **File sent successfully to your chat!**\n\n"
-                f"🔄 Send another YouTube link to download more!",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔄 Download Another", callback_data="new_download")]
-                ])
-            )
-        else:
-            await progress_msg.edit_text(
-                f"❌ **Download failed!**\n\n"
-                f"🎬 **{title}**\n"
-                f"Please try again or choose different quality."
-            )
-            
+        
+        # Send completion message
+        await progress_msg.edit_text(
+            f"✅ **Download Completed!**\n\n"
+            f"🎬 **{title}**\n"
+            f"📱 **File sent successfully to your chat!**\n\n"
+            f"🔄 Send another YouTube link to download more!",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔄 Download Another", callback_data="new_download")]
+            ])
+        )
+    else:
+        await progress_msg.edit_text(
+            f"❌ **Download failed!**\n\n"
+            f"🎬 **{title}**\n"
+            f"Please try again or choose different quality."
+        )
+
+async def restore_progress_message(job, subscriber, text):
+    """Reuse a subscriber's progress message after a restart, or send a new one"""
+    try:
+        if subscriber.get('message_id'):
+            message = await app.get_messages(subscriber['chat_id'], subscriber['message_id'])
+            if message and not message.empty:
+                await message.edit_text(text, reply_markup=cancel_markup(job))
+                return message
+    except Exception as e:
+        log.warning("progress_restore_error", job_id=job['job_id'], user_id=subscriber['user_id'], error=str(e))
+    return await app.send_message(subscriber['user_id'], text, reply_markup=cancel_markup(job))
+
+async def resume_job(job):
+    """Resume a job that was interrupted by a restart, for everyone who was waiting for it"""
+    title = job['title']
+    try:
+        await journal.transition(job, job['state'], resumes=job.get('resumes', 0) + 1)
+        
+        # Jobs journaled before subscribers were recorded only know their target
+        subscribers = job.get('subscribers') or [{"user_id": job['user_id']}]
+        
+        # Let everyone know their download wasn't lost
+        text = (
+            f"♻️ **Resuming your download...**\n🎬 **{title}**\n"
+            f"⏳ The bot restarted - continuing where it left off."
+        )
+        progress_msgs = {
+            subscriber['user_id']: await restore_progress_message(job, subscriber, text)
+            for subscriber in subscribers
+        }
+        
+        key = job_key(job['url'], job['format_id'], job['format_type'], job.get('clip'))
+        entry = inflight.start(key, job, lambda entry: run_shared_job(app, entry), cancel_markup(job))
+        results = {user_id: entry.attach(user_id, progress_msg) for user_id, progress_msg in progress_msgs.items()}
+        await save_subscribers(entry)
+        
+        await asyncio.gather(*(
+            deliver_shared_job(user_id, progress_msgs[user_id], entry, result) for user_id, result in results.items()
+        ))
+        
     except Exception as e:
-        await callback_query.message.edit_text(f"❌ **Error:** {str(e)}")
+        log.error("resume_error", job_id=job['job_id'], error=str(e))
+        await journal.transition(job, JOB_FAILED, error=str(e))
+        remove_scratch_dir(job)
+
+async def resume_unfinished_jobs():
+    """Resume every job that was still running when the bot stopped"""
+    jobs = await journal.unfinished()
+    for job in jobs:
+        if not is_resumable(job):
+            await journal.transition(job, JOB_ABANDONED)
+            remove_scratch_dir(job)
+            continue
+        
+        # The task inherits the job's trace ID
+        with trace(job['job_id']):
+            log.info("job_resuming", job_id=job['job_id'], state=job['state'], title=job['title'])
+            asyncio.create_task(resume_job(job))
+
+# Cancel callback
+@app.on_callback_query(filters.regex(r"^cancel_([0-9a-f]+)$"))
+async def cancel_callback(client, callback_query: CallbackQuery):
+    job_id = callback_query.data.split('_', 1)[1]
+    user_id = callback_query.from_user.id
+    
+    # Only this user stops waiting - a shared download continues for the others
+    entry = inflight.find_job(job_id)
+    if not entry or not entry.detach(user_id):
+        await callback_query.answer("Nothing to cancel - this download already finished.")
+        return
+    
+    log.info("job_detached", job_id=job_id, user_id=user_id, remaining=len(entry.subscribers))
+    # The file may now go to someone else - a restart must not deliver it to this user
+    await save_subscribers(entry)
+    await callback_query.answer("❌ Download cancelled")
+    await callback_query.message.edit_text(f"❌ **Download cancelled.**\n🎬 **{entry.job['title']}**")
 
 # Admin stats command
 @app.on_message(filters.command("stats") & filters.user(ADMIN_USER_ID))
 async def stats_handler(client, message):
     try:
         total_users = await users_col.count_documents({})
-        total_downloads = await downloads_col.count_documents({})
+        total_downloads = await retention.total_downloads()
         
         # Recent stats (last 24 hours)
         yesterday = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         recent_downloads = await downloads_col.count_documents({"download_time": {"$gte": yesterday}})
         
-        # Top downloaded formats
-        pipeline = [
-            {"$group": {"_id": "$format_type", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ]
-        format_stats = await downloads_col.aggregate(pipeline).to_list(length=10)
+        # Top downloaded formats (includes days already rolled into summaries)
+        format_stats = await retention.format_type_counts()
+        
+        # Audio made from local copies instead of fetched from YouTube
+        derived = await media_cache.derivation_totals()
         
         stats_text = f"""
 📊 **Bot Statistics**
@@ -271,12 +732,13 @@ async def stats_handler(client, message):
 👥 **Total Users:** {total_users:,}
 📥 **Total Downloads:** {total_downloads:,}
 🔥 **Today's Downloads:** {recent_downloads:,}
+♻️ **Audio Derived Locally:** {derived['count']:,} ({format_file_size(derived['bytes_saved'])} saved)
 
 📊 **Popular Formats:**
 """
         
-        for stat in format_stats[:3]:
-            stats_text += f"• {stat['_id'].title()}: {stat['count']} downloads\n"
+        for format_type, count in format_stats[:3]:
+            stats_text += f"• {format_type.title()}: {count} downloads\n"
         
         stats_text += f"\n🕐 **Updated:** {datetime.now().strftime('%H:%M:%S')}"
         
@@ -330,6 +792,8 @@ async def help_callback(client, callback_query):
 3️⃣ Wait for download to complete
 4️⃣ File will be sent directly to your chat!
 
+✂️ **Only need a part?** Send `link 1:20-1:50` or tap **Clip a part**
+
 🎥 **Video Qualities:** 240p, 360p, 480p, 720p, 1080p, 1440p, 2160p
 🎵 **Audio Formats:** MP3, M4A, Opus
 
@@ -376,8 +840,23 @@ async def new_download_callback(client, callback_query):
         "🎥 **Ready for new download!**\n\n📝 Send me any YouTube link to get started."
     )
 
+async def main():
+    """Start the bot, resume interrupted jobs and run until stopped"""
+    await asyncio.to_thread(ytdl_pool.prewarm)
+    await app.start()
+    await upload_pool.start()
+    await throughput.load(throughput_col)
+    await journal.ensure_indexes()
+    await resume_unfinished_jobs()
+    asyncio.create_task(periodic_cleanup())
+    
+    # Compacts the backlog first, then creates the TTL index
+    asyncio.create_task(retention.run_periodically())
+    await idle()
+    await upload_pool.stop()
+    await app.stop()
+
 # Run bot
 if __name__ == "__main__":
-    print("🚀 Starting Professional YT Downloader Bot...")
-    print("✅ No AWS required - Direct Telegram delivery!")
-    app.run()
+    log.info("bot_starting", node=NODE_ID)
+    app.run(main())
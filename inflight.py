@@ -0,0 +1,98 @@
+import asyncio
+from config import *
+from logs import *
+
+log = get_logger(__name__)
+
+class InflightDownload:
+    """One running job shared by every user who asked for the same (video, format).
+
+    Acts like a progress message: edit_text() updates the progress message
+    of every attached user.
+    """
+    def __init__(self, key, job, reply_markup=None):
+        self.key = key
+        self.job = job
+        self.reply_markup = reply_markup
+        self.subscribers = {}  # user_id -> {"message": progress message, "result": future}
+        self.last_text = None
+        self.task = None
+
+    def attach(self, user_id, progress_msg):
+        """Attach a user; returns a future with the job's result (None if they cancel)"""
+        if user_id in self.subscribers:
+            return self.subscribers[user_id]['result']
+        result = asyncio.get_running_loop().create_future()
+        self.subscribers[user_id] = {"message": progress_msg, "result": result}
+        return result
+
+    def detach(self, user_id):
+        """Detach a user without stopping the job for anyone else"""
+        subscriber = self.subscribers.pop(user_id, None)
+        if not subscriber:
+            return False
+        if not subscriber['result'].done():
+            subscriber['result'].set_result(None)
+
+        if not self.subscribers:
+            # Nobody is waiting any more - stop the work itself
+            if self.task and not self.task.done():
+                self.task.cancel()
+        elif self.job['user_id'] == user_id:
+            # The file goes to someone who still wants it
+            self.job['user_id'] = next(iter(self.subscribers))
+        return True
+
+    def subscriber_records(self):
+        """Who is waiting and where their progress message is, in a form the journal can store"""
+        return [
+            {"user_id": user_id, "chat_id": subscriber['message'].chat.id, "message_id": subscriber['message'].id}
+            for user_id, subscriber in self.subscribers.items()
+        ]
+
+    def finish(self, task):
+        """Hand the job's result to everyone still attached"""
+        result = False if task.cancelled() or task.exception() else task.result()
+        for subscriber in self.subscribers.values():
+            if not subscriber['result'].done():
+                subscriber['result'].set_result(result)
+
+    async def edit_text(self, text):
+        """Show the same progress to every attached user"""
+        self.last_text = text
+        await asyncio.gather(*(
+            self._edit(subscriber['message'], text) for subscriber in list(self.subscribers.values())
+        ))
+
+    async def _edit(self, message, text):
+        try:
+            await message.edit_text(text, reply_markup=self.reply_markup)
+        except Exception as e:
+            log.warning("progress_update_error", error=str(e))
+
+class InflightRegistry:
+    """Running jobs keyed by (video_id, format_id, format_type, clip)"""
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def find_job(self, job_id):
+        return next((entry for entry in self.entries.values() if entry.job['job_id'] == job_id), None)
+
+    def start(self, key, job, coro, reply_markup=None):
+        """Register a job and run it in its own task, so no single requester owns it"""
+        entry = InflightDownload(key, job, reply_markup)
+        self.entries[key] = entry
+        entry.task = asyncio.create_task(coro(entry))
+        entry.task.add_done_callback(lambda task: self._finished(entry, task))
+        return entry
+
+    def _finished(self, entry, task):
+        if self.entries.get(entry.key) is entry:
+            del self.entries[entry.key]
+        entry.finish(task)
+
+# Shared registry instance
+inflight = InflightRegistry()
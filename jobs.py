@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import aiofiles
+from datetime import datetime, timezone
+from config import *
+from logs import *
+
+# Job states, in the order a healthy job moves through them
+JOB_QUEUED = 'queued'
+JOB_DOWNLOADING = 'downloading'
+JOB_DOWNLOADED = 'downloaded'
+JOB_UPLOADING = 'uploading'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_ABANDONED = 'abandoned'
+JOB_CANCELLED = 'cancelled'
+
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_ABANDONED, JOB_CANCELLED)
+
+log = get_logger(__name__)
+
+class MongoJobStore:
+    """Job store backed by a MongoDB collection"""
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        """Index lookups by job and state, and expire finished jobs after a while"""
+        await self.collection.create_index("job_id", unique=True)
+        await self.collection.create_index("state")
+        await self.collection.create_index(
+            "finished_at", expireAfterSeconds=JOB_HISTORY_RETENTION_DAYS * 24 * 60 * 60
+        )
+
+    async def insert(self, job):
+        await self.collection.insert_one(dict(job))
+
+    async def update(self, job_id, fields, event):
+        fields = dict(fields)
+        # Finished jobs are only kept for a while (TTL index on finished_at)
+        if fields.get('state') in FINISHED_STATES:
+            fields['finished_at'] = datetime.now(timezone.utc)
+        await self.collection.update_one(
+            {"job_id": job_id},
+            {"$set": fields, "$push": {"history": event}}
+        )
+
+    async def find(self, job_id):
+        return await self.collection.find_one({"job_id": job_id}, {"_id": 0})
+
+    async def find_unfinished(self):
+        return await self.collection.find(
+            {"state": {"$nin": list(FINISHED_STATES)}}, {"_id": 0}
+        ).to_list(length=None)
+
+class LocalJobStore:
+    """Job store backed by a JSON file, used when MongoDB is not available"""
+    def __init__(self, path=JOB_JOURNAL_PATH):
+        self.path = path
+        self.lock = asyncio.Lock()
+        self.jobs = None
+
+    async def ensure_indexes(self):
+        # Finished jobs are dropped on update, nothing to index or expire
+        pass
+
+    async def _load(self):
+        if self.jobs is not None:
+            return
+        self.jobs = {}
+        if os.path.exists(self.path):
+            try:
+                async with aiofiles.open(self.path, 'r') as f:
+                    self.jobs = json.loads(await f.read())
+            except Exception as e:
+                log.error("job_journal_load_error", error=str(e))
+
+    async def _save(self):
+        # Write to a temp file first so a crash never leaves a half-written journal
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        async with aiofiles.open(temp_path, 'w') as f:
+            await f.write(json.dumps(self.jobs))
+        os.replace(temp_path, self.path)
+
+    async def insert(self, job):
+        async with self.lock:
+            await self._load()
+            self.jobs[job['job_id']] = dict(job)
+            await self._save()
+
+    async def update(self, job_id, fields, event):
+        async with self.lock:
+            await self._load()
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            job.update(fields)
+            job.setdefault('history', []).append(event)
+            # Finished jobs are only kept for their outcome, not their history
+            if job.get('state') in FINISHED_STATES:
+                self.jobs.pop(job_id)
+            await self._save()
+
+    async def find(self, job_id):
+        async with self.lock:
+            await self._load()
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    async def find_unfinished(self):
+        async with self.lock:
+            await self._load()
+            return [dict(job) for job in self.jobs.values() if job.get('state') not in FINISHED_STATES]
+
+class JobJournal:
+    """Records download jobs and their state transitions so they survive restarts"""
+    def __init__(self, store):
+        self.store = store
+
+    async def ensure_indexes(self):
+        try:
+            await self.store.ensure_indexes()
+        except Exception as e:
+            log.error("job_journal_index_error", error=str(e))
+
+    async def create(self, user_id, url, format_id, format_type, title, expected_size=0, clip=None, audio=None):
+        """Create a new job with its own scratch directory"""
+        job_id = uuid.uuid4().hex[:16]
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "user_id": user_id,
+            "url": url,
+            "format_id": format_id,
+            "format_type": format_type,
+            "title": title,
+            "expected_size": expected_size,
+            "clip": list(clip) if clip else None,
+            "audio": audio,
+            "state": JOB_QUEUED,
+            "scratch_dir": os.path.join(JOB_SCRATCH_PATH, job_id) + os.sep,
+            "file_path": None,
+            "resumes": 0,
+            "created_at": now,
+            "updated_at": now,
+            "history": [{"state": JOB_QUEUED, "time": now}],
+        }
+        os.makedirs(job['scratch_dir'], exist_ok=True)
+        await self.store.insert(job)
+        return job
+
+    async def transition(self, job, state, **fields):
+        """Move a job to a new state, updating the local copy as well"""
+        now = time.time()
+        fields.update({"state": state, "updated_at": now})
+        job.update(fields)
+        log.info("job_state", job_id=job['job_id'], state=state)
+        try:
+            await self.store.update(job['job_id'], fields, {"state": state, "time": now})
+        except Exception as e:
+            # A journal failure must never fail the download itself
+            log.error("job_journal_update_error", job_id=job['job_id'], state=state, error=str(e))
+
+    async def get(self, job_id):
+        return await self.store.find(job_id)
+
+    async def unfinished(self):
+        """Get all jobs that were still running when the bot stopped"""
+        try:
+            return await self.store.find_unfinished()
+        except Exception as e:
+            log.error("job_journal_read_error", error=str(e))
+            return []
+
+def remove_scratch_dir(job):
+    """Delete a job's scratch directory and everything in it"""
+    try:
+        scratch_dir = job.get('scratch_dir')
+        if scratch_dir and os.path.isdir(scratch_dir):
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            log.info("job_scratch_removed", scratch_dir=scratch_dir)
+    except Exception as e:
+        log.error("job_scratch_cleanup_error", error=str(e))
+
+def is_resumable(job):
+    """Check if an unfinished job is recent enough to be resumed"""
+    return (time.time() - job.get('created_at', 0)) <= JOB_RESUME_MAX_AGE
+
+def get_finished_file(job):
+    """Get the completed download of a job, if it survived the restart"""
+    file_path = job.get('file_path')
+    if file_path and os.path.exists(file_path) and os.path.getsize(file_path) > 100:
+        return file_path
+    return None
@@ -0,0 +1,137 @@
+import sys
+import json
+import time
+import queue
+import uuid
+import atexit
+import random
+import logging
+import contextvars
+import functools
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from config import *
+
+# Trace ID of the job (or message) being handled, follows tasks and worker threads
+trace_id_var = contextvars.ContextVar('trace_id', default=None)
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            data["trace_id"] = trace_id
+        data.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        if getattr(record, 'dropped_before', 0):
+            data["dropped_before"] = record.dropped_before
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records when the buffer is full instead of blocking"""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, keep the hot path cheap
+        return record
+
+    def enqueue(self, record):
+        record.dropped_before = self.dropped
+        try:
+            self.queue.put_nowait(record)
+            self.dropped = 0
+        except queue.Full:
+            self.dropped += 1
+
+class StructuredLogger:
+    """Logs an event name plus key/value fields, tagged with the current trace ID"""
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def _log(self, level, event, fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={"fields": fields, "trace_id": trace_id_var.get()})
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def sampled(self, event, rate=LOG_PROGRESS_SAMPLE_RATE, **fields):
+        """Log only a fraction of a high-volume event"""
+        if random.random() < rate:
+            fields["sample_rate"] = rate
+            self._log(logging.INFO, event, fields)
+
+    @contextmanager
+    def timed(self, event, **fields):
+        """Log an event with its duration once the block finishes"""
+        start = time.monotonic()
+        fields["ok"] = False
+        try:
+            yield fields
+            fields["ok"] = True
+        finally:
+            fields["duration_ms"] = int((time.monotonic() - start) * 1000)
+            self._log(logging.INFO, event, fields)
+
+def get_logger(name):
+    return StructuredLogger(name)
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def trace(trace_id=None):
+    """Tag every log record in the block with a trace ID"""
+    token = trace_id_var.set(trace_id or new_trace_id())
+    try:
+        yield trace_id_var.get()
+    finally:
+        trace_id_var.reset(token)
+
+def traced(func):
+    """Run an async handler under a fresh trace ID"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with trace():
+            return await func(*args, **kwargs)
+    return wrapper
+
+_listener = None
+
+def setup_logging():
+    """Send all logging through a bounded queue to a background JSON writer"""
+    global _listener
+    if _listener:
+        return
+    
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+setup_logging()
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+from datetime import datetime
+from config import *
+from logs import *
+
+log = get_logger(__name__)
+
+DERIVATION_METRIC = "audio_derivation"
+
+# Requested audio extension -> (codec name as ffprobe reports it, ffmpeg encoder)
+AUDIO_TARGETS = {
+    'm4a': ('aac', 'aac'),
+    'mp3': ('mp3', 'libmp3lame'),
+    'opus': ('opus', 'libopus'),
+    'webm': ('opus', 'libopus'),
+}
+
+async def run_tool(*args):
+    """Run ffmpeg/ffprobe, returning (exit code, stdout, stderr)"""
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+async def probe_audio(file_path):
+    """Get the codec and bitrate (bits/s, 0 if unknown) of a file's first audio track, or None"""
+    code, stdout, _ = await run_tool(
+        'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,bit_rate', '-of', 'json', file_path
+    )
+    if code != 0:
+        return None
+    streams = json.loads(stdout or '{}').get('streams') or []
+    if not streams:
+        return None
+    bit_rate = streams[0].get('bit_rate')
+    return {
+        "codec": streams[0].get('codec_name'),
+        "bit_rate": int(bit_rate) if str(bit_rate or '').isdigit() else 0,
+    }
+
+class MediaCache:
+    """Keeps finished downloads per video ID for a while, so audio can be derived without YouTube"""
+    def __init__(self, path=MEDIA_CACHE_PATH, ttl=MEDIA_CACHE_TTL, max_bytes=MEDIA_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.collection = None
+        self.enabled = bool(shutil.which('ffmpeg') and shutil.which('ffprobe'))
+        if not self.enabled:
+            log.warning("media_cache_disabled", reason="ffmpeg/ffprobe not found")
+
+    def attach_metrics(self, collection):
+        """Persist derivation metrics to a MongoDB collection"""
+        self.collection = collection
+
+    def _video_dir(self, video_id):
+        return os.path.join(self.path, video_id)
+
+    async def store(self, video_id, file_path):
+        """Keep a finished download that has an audio track (video-only files can never be a source)"""
+        if not self.enabled or not video_id:
+            return None
+        try:
+            if not await probe_audio(file_path):
+                log.info("media_cache_skipped", video_id=video_id, reason="no audio track")
+                return None
+        except Exception as e:
+            log.error("media_cache_probe_error", video_id=video_id, error=str(e))
+            return None
+        # The fallback copy can be gigabytes - keep it off the event loop
+        return await asyncio.to_thread(self._store, video_id, file_path)
+
+    def _store(self, video_id, file_path):
+        """Hard-link a file into the cache, so the job can still delete its copy (blocking)"""
+        try:
+            video_dir = self._video_dir(video_id)
+            os.makedirs(video_dir, exist_ok=True)
+            cache_path = os.path.join(video_dir, os.path.basename(file_path))
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            try:
+                os.link(file_path, cache_path)
+            except OSError:
+                # Different filesystem - fall back to a real copy
+                shutil.copy2(file_path, cache_path)
+            # mtime is the cache's clock - stamp the time it was cached, not when the video was published
+            os.utime(cache_path)
+            log.info("media_cached", video_id=video_id, size=os.path.getsize(cache_path))
+            self.evict()
+            return cache_path if os.path.exists(cache_path) else None
+        except Exception as e:
+            log.error("media_cache_store_error", video_id=video_id, error=str(e))
+            return None
+
+    def _cached_files(self):
+        """All cached files as (mtime, size, path), oldest first"""
+        files = []
+        if not os.path.exists(self.path):
+            return files
+        for video_id in os.listdir(self.path):
+            video_dir = self._video_dir(video_id)
+            if not os.path.isdir(video_dir):
+                continue
+            for filename in os.listdir(video_dir):
+                file_path = os.path.join(video_dir, filename)
+                stat = os.stat(file_path)
+                files.append((stat.st_mtime, stat.st_size, file_path))
+        return sorted(files)
+
+    def _remove(self, file_path):
+        os.remove(file_path)
+        video_dir = os.path.dirname(file_path)
+        if not os.listdir(video_dir):
+            os.rmdir(video_dir)
+
+    def evict(self):
+        """Remove expired files, then the oldest ones until the cache fits its size limit"""
+        try:
+            files = self._cached_files()
+            total = sum(size for _, size, _ in files)
+            now = time.time()
+            removed = 0
+            for mtime, size, file_path in files:
+                if now - mtime <= self.ttl and total <= self.max_bytes:
+                    break
+                self._remove(file_path)
+                total -= size
+                removed += 1
+            if removed:
+                log.info("media_cache_evicted", files=removed, remaining_bytes=total)
+        except Exception as e:
+            log.error("media_cache_evict_error", error=str(e))
+
+    async def find_audio_source(self, video_id, target_codec, abr):
+        """Newest cached file of a video with an audio track good enough for the requested bitrate"""
+        # Eviction runs in worker threads, so files (or the whole directory) can vanish at any point
+        video_dir = self._video_dir(video_id)
+        try:
+            filenames = os.listdir(video_dir)
+        except OSError:
+            return None, None
+        candidates = []
+        for filename in filenames:
+            file_path = os.path.join(video_dir, filename)
+            try:
+                candidates.append((os.path.getmtime(file_path), file_path))
+            except OSError:
+                continue
+        
+        fallback = None
+        for mtime, file_path in sorted(candidates, reverse=True):
+            if time.time() - mtime > self.ttl:
+                continue
+            audio = await probe_audio(file_path)
+            # Unknown bitrates (common for Opus in WebM) are trusted
+            if not audio or (abr and audio['bit_rate'] and audio['bit_rate'] < abr * 1000 * AUDIO_MIN_SOURCE_BITRATE_RATIO):
+                continue
+            # A track that only needs copying beats one that needs transcoding
+            if audio['codec'] == target_codec:
+                return file_path, audio
+            fallback = fallback or (file_path, audio)
+        return fallback or (None, None)
+
+    async def derive_audio(self, video_id, audio_ext, abr, output_path):
+        """Produce the requested audio from a cached file; returns (path, source path, method) or None"""
+        if not self.enabled or not video_id or audio_ext not in AUDIO_TARGETS:
+            return None
+
+        target_codec, encoder = AUDIO_TARGETS[audio_ext]
+        source_path, audio = await self.find_audio_source(video_id, target_codec, abr)
+        if not source_path:
+            return None
+
+        if audio['codec'] == target_codec:
+            method = "copy"
+            codec_args = ['-c:a', 'copy']
+        else:
+            method = "transcode"
+            codec_args = ['-c:a', encoder, '-b:a', f"{int(abr or 128)}k"]
+
+        output_path = f"{output_path}.{audio_ext}"
+        code, _, stderr = await run_tool(
+            'ffmpeg', '-y', '-v', 'error', '-i', source_path,
+            '-map', '0:a:0', '-vn', *codec_args, output_path
+        )
+        if code != 0 or not os.path.exists(output_path):
+            log.warning("audio_derivation_failed", video_id=video_id, method=method, error=stderr[-500:])
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        return output_path, source_path, method
+
+    async def record_derivation(self, video_id, method, bytes_saved, derived_bytes, seconds):
+        """Count a derivation and the upstream bytes it saved"""
+        log.info(
+            "audio_derived",
+            video_id=video_id,
+            method=method,
+            bytes_saved=bytes_saved,
+            size=derived_bytes,
+            duration_ms=int(seconds * 1000),
+        )
+        if self.collection is None:
+            return
+        try:
+            await self.collection.update_one(
+                {"metric": DERIVATION_METRIC, "node": NODE_ID, "date": datetime.now().strftime('%Y-%m-%d')},
+                {"$inc": {
+                    "count": 1,
+                    f"by_method.{method}": 1,
+                    "bytes_saved": bytes_saved,
+                    "derived_bytes": derived_bytes,
+                    "seconds": seconds,
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            log.error("derivation_metrics_error", error=str(e))
+
+    async def derivation_totals(self):
+        """Derivations and saved bytes across all nodes and days"""
+        if self.collection is None:
+            return {"count": 0, "bytes_saved": 0}
+        result = await self.collection.aggregate([
+            {"$match": {"metric": DERIVATION_METRIC}},
+            {"$group": {"_id": None, "count": {"$sum": "$count"}, "bytes_saved": {"$sum": "$bytes_saved"}}},
+        ]).to_list(length=1)
+        return {"count": result[0]['count'], "bytes_saved": result[0]['bytes_saved']} if result else {"count": 0, "bytes_saved": 0}
+
+# Shared cache instance
+media_cache = MediaCache()
@@ -0,0 +1,110 @@
+from datetime import datetime
+from config import *
+from logs import *
+
+DOWNLOAD = 'download'
+UPLOAD = 'upload'
+
+# Per-job overhead that doesn't depend on size (extraction, muxing, Telegram processing)
+JOB_OVERHEAD_SECONDS = 5
+
+log = get_logger(__name__)
+
+def estimate_format_size(f, duration=0):
+    """Estimate the size of a yt-dlp format in bytes (0 if unknown)"""
+    size = f.get('filesize') or f.get('filesize_approx')
+    if size:
+        return int(size)
+
+    # Fall back to bitrate x duration (bitrates are in kbps)
+    bitrate = f.get('tbr') or ((f.get('vbr') or 0) + (f.get('abr') or 0))
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)
+    return 0
+
+def format_eta(seconds):
+    """Format seconds in human readable format"""
+    if seconds is None or seconds <= 0:
+        return "Unknown"
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    elif seconds < 3600:
+        return f"{int(seconds/60)}m {int(seconds%60)}s"
+    else:
+        return f"{int(seconds/3600)}h {int((seconds%3600)/60)}m"
+
+class ThroughputPredictor:
+    """Learns download/upload throughput from real jobs (EWMA per node and hour of day)"""
+    def __init__(self, node_id=NODE_ID, alpha=THROUGHPUT_EWMA_ALPHA):
+        self.node_id = node_id
+        self.alpha = alpha
+        self.collection = None
+        # (direction, hour) -> {"speed": bytes/s, "samples": n}; hour 'all' is the node-wide average
+        self.rates = {}
+
+    async def load(self, collection):
+        """Load learned throughput for this node from MongoDB"""
+        self.collection = collection
+        try:
+            async for doc in collection.find({"node": self.node_id}):
+                self.rates[(doc['direction'], doc['hour'])] = {
+                    "speed": doc['speed'],
+                    "samples": doc.get('samples', 0),
+                }
+            log.info("throughput_loaded", node=self.node_id, buckets=len(self.rates))
+        except Exception as e:
+            log.error("throughput_load_error", error=str(e))
+
+    def _update(self, direction, hour, speed):
+        rate = self.rates.get((direction, hour))
+        if rate:
+            rate['speed'] = self.alpha * speed + (1 - self.alpha) * rate['speed']
+            rate['samples'] += 1
+        else:
+            rate = {"speed": speed, "samples": 1}
+            self.rates[(direction, hour)] = rate
+        return rate
+
+    async def record(self, direction, size_bytes, seconds):
+        """Record the throughput of a finished download or upload"""
+        if size_bytes < MIN_THROUGHPUT_SAMPLE_SIZE or seconds <= 0:
+            return
+
+        speed = size_bytes / seconds
+        hour = datetime.now().hour
+        for bucket in (hour, 'all'):
+            rate = self._update(direction, bucket, speed)
+            if self.collection is None:
+                continue
+            try:
+                await self.collection.update_one(
+                    {"node": self.node_id, "direction": direction, "hour": bucket},
+                    {
+                        "$set": {"speed": rate['speed'], "samples": rate['samples'], "updated_at": datetime.now()},
+                        "$inc": {"total_bytes": size_bytes, "total_seconds": seconds},
+                    },
+                    upsert=True
+                )
+            except Exception as e:
+                log.error("throughput_save_error", error=str(e))
+
+    def speed(self, direction, hour=None):
+        """Get the expected throughput in bytes/s for the given hour (default: now)"""
+        hour = datetime.now().hour if hour is None else hour
+        for bucket in (hour, 'all'):
+            rate = self.rates.get((direction, bucket))
+            if rate:
+                return rate['speed']
+        return DEFAULT_DOWNLOAD_SPEED if direction == DOWNLOAD else DEFAULT_UPLOAD_SPEED
+
+    def predict_download_seconds(self, size_bytes):
+        return size_bytes / self.speed(DOWNLOAD) if size_bytes > 0 else None
+
+    def predict_delivery_seconds(self, size_bytes):
+        """Predict the time from pressing a button to having the file in the chat"""
+        if size_bytes <= 0:
+            return None
+        return JOB_OVERHEAD_SECONDS + size_bytes / self.speed(DOWNLOAD) + size_bytes / self.speed(UPLOAD)
+
+# Shared predictor instance
+throughput = ThroughputPredictor()
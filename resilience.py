@@ -0,0 +1,245 @@
+import time
+import random
+import asyncio
+from collections import deque
+from config import *
+from logs import *
+
+log = get_logger(__name__)
+
+# How often deferred work checks whether the breaker lets it through
+BREAKER_POLL_INTERVAL = 1.0
+
+# Error classes
+RETRYABLE = 'retryable'  # Transient network/server trouble - try again
+THROTTLED = 'throttled'  # YouTube is limiting us - try again, and count towards the breaker
+FATAL = 'fatal'  # Retrying won't help
+
+FATAL_PATTERNS = (
+    'video unavailable', 'private video', 'is not available', 'members-only', 'members only',
+    'unsupported url', 'requested format is not available', 'copyright', 'has been removed',
+    'age-restricted', 'inappropriate', 'premieres in', 'live event will begin',
+)
+THROTTLE_PATTERNS = (
+    'http error 429', 'too many requests', 'http error 403', 'rate-limit', 'rate limit',
+    "confirm you're not a bot", 'confirm you’re not a bot',
+)
+RETRYABLE_PATTERNS = (
+    'http error 5', 'timed out', 'timeout', 'connection reset', 'connection refused',
+    'connection aborted', 'remote end closed', 'temporary failure', 'incompleteread',
+    'getaddrinfo', 'network is unreachable', 'ssl', 'unable to download webpage',
+    'did not get any data blocks', 'fragment',
+)
+
+def classify_error(e):
+    """Classify an extraction/download error as RETRYABLE, THROTTLED or FATAL"""
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return RETRYABLE
+    
+    # yt-dlp wraps the original error; an HTTP status is the most reliable signal
+    exc_info = getattr(e, 'exc_info', None)
+    cause = exc_info[1] if exc_info else None
+    status = getattr(cause, 'status', None) or getattr(cause, 'code', None)
+    if status in (403, 429):
+        return THROTTLED
+    if isinstance(status, int) and status >= 500:
+        return RETRYABLE
+    
+    message = f"{e} {cause or ''}".lower()
+    if any(pattern in message for pattern in FATAL_PATTERNS):
+        return FATAL
+    if any(pattern in message for pattern in THROTTLE_PATTERNS):
+        return THROTTLED
+    if any(pattern in message for pattern in RETRYABLE_PATTERNS):
+        return RETRYABLE
+    return FATAL
+
+def user_error_message(e):
+    """Friendly message for an error instead of the raw exception text"""
+    message = str(e).lower()
+    kind = classify_error(e)
+    if kind == THROTTLED:
+        return ERROR_MESSAGES['rate_limit']
+    if kind == RETRYABLE:
+        return ERROR_MESSAGES['network_error']
+    if 'requested format is not available' in message:
+        return ERROR_MESSAGES['format_not_available']
+    if any(pattern in message for pattern in FATAL_PATTERNS):
+        return '❌ This video is not available for download.'
+    return ERROR_MESSAGES['download_failed']
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class RetryBudget:
+    """Caps retries to a fraction of requests across all users, so retries can't snowball"""
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, max_tokens=RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class CircuitBreaker:
+    """Stops new work while YouTube is throttling us, then lets a single probe through"""
+    def __init__(self, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW, cooldown=BREAKER_COOLDOWN,
+                 probe_timeout=BREAKER_PROBE_TIMEOUT):
+        self.threshold = threshold
+        self.window = window
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.failures = deque()
+        self.opened_at = None
+        self.probe_started = None
+
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def probing(self):
+        """A half-open probe is on its way and hasn't reported back yet"""
+        return self.probe_started is not None and time.monotonic() - self.probe_started < self.probe_timeout
+
+    def is_open(self):
+        """True while new work should be shed or deferred (cooling down, or a probe is out)"""
+        state = self.state()
+        return state == 'open' or (state == 'half_open' and self.probing())
+
+    def try_acquire(self):
+        """Admit a call upstream: returns 'probe' for the single half-open probe, True when closed, else False"""
+        state = self.state()
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.probing():
+            self.probe_started = time.monotonic()
+            log.info("breaker_probe")
+            return 'probe'
+        return False
+
+    def release_probe(self):
+        """The probe ended without telling us anything about throttling - let another one try"""
+        self.probe_started = None
+
+    async def admit(self):
+        """Wait until a call may go upstream; True if this call is the half-open probe"""
+        while True:
+            admitted = self.try_acquire()
+            if admitted:
+                return admitted == 'probe'
+            await asyncio.sleep(max(self.retry_after(), BREAKER_POLL_INTERVAL))
+
+    def retry_after(self):
+        """Seconds until the breaker lets work through again (a poll interval while the probe is out)"""
+        if self.opened_at is None:
+            return 0
+        if self.state() == 'half_open':
+            return BREAKER_POLL_INTERVAL if self.probing() else 0
+        return max(0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_throttle(self):
+        now = time.monotonic()
+        state = self.state()
+        if state == 'half_open':
+            # The probe was throttled too - back off for longer
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+            self.opened_at = now
+            self.probe_started = None
+            log.warning("breaker_reopened", cooldown=self.cooldown)
+            return
+        
+        self.failures.append(now)
+        while self.failures and now - self.failures[0] > self.window:
+            self.failures.popleft()
+        if state == 'closed' and len(self.failures) >= self.threshold:
+            self.opened_at = now
+            log.warning("breaker_opened", failures=len(self.failures), cooldown=self.cooldown)
+
+    def record_success(self):
+        """Close the breaker when the half-open probe succeeds.
+        
+        While closed, throttles are only forgotten as they leave the window, so a mix
+        of successes and throttles still opens the breaker.
+        """
+        if self.state() != 'half_open':
+            return
+        log.info("breaker_closed")
+        self.opened_at = None
+        self.probe_started = None
+        self.cooldown = self.base_cooldown
+        self.failures.clear()
+
+    async def wait_until_closed(self):
+        """Defer work until the breaker stops rejecting it (it may then become the probe)"""
+        while self.is_open():
+            await asyncio.sleep(max(self.retry_after(), BREAKER_POLL_INTERVAL))
+
+async def hedged(func, delay=HEDGE_DELAY):
+    """Run func(); if it's slow, start a second copy and return whichever succeeds first"""
+    first = asyncio.create_task(func())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done or youtube_breaker.state() != 'closed' or not retry_budget.try_spend():
+        return await first
+    
+    log.info("hedge_started", delay=delay)
+    pending = {first, asyncio.create_task(func())}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            error = task.exception()
+    raise error
+
+async def call_with_retries(func, what, on_retry=None, max_attempts=RETRY_MAX_ATTEMPTS):
+    """Call func() with jittered backoff on retryable errors, within the global retry budget"""
+    retry_budget.record_request()
+    attempt = 0
+    while True:
+        # While half-open only one call goes upstream; the rest wait for its outcome
+        probe = await youtube_breaker.admit()
+        try:
+            result = await func()
+            youtube_breaker.record_success()
+            return result
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == THROTTLED:
+                youtube_breaker.record_throttle()
+            elif probe:
+                # Not a throttling answer - hand the probe to the next call
+                youtube_breaker.release_probe()
+                probe = False
+            
+            attempt += 1
+            if kind == FATAL or attempt >= max_attempts or youtube_breaker.is_open() or not retry_budget.try_spend():
+                log.warning("call_failed", what=what, kind=kind, attempts=attempt, error=str(e))
+                raise
+            
+            delay = backoff_delay(attempt)
+            log.warning("call_retrying", what=what, kind=kind, attempt=attempt, delay=round(delay, 2), error=str(e))
+            if on_retry:
+                await on_retry(attempt, delay)
+            await asyncio.sleep(delay)
+        finally:
+            # Cancelled mid-probe - don't make everyone wait for the probe timeout
+            if probe and youtube_breaker.probing():
+                youtube_breaker.release_probe()
+
+# Shared instances - every user's work counts against the same upstream
+retry_budget = RetryBudget()
+youtube_breaker = CircuitBreaker()
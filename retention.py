@@ -0,0 +1,152 @@
+import os
+import gzip
+import json
+import asyncio
+from datetime import datetime, timedelta
+from pymongo.errors import OperationFailure
+from config import *
+from logs import *
+
+log = get_logger(__name__)
+
+TTL_INDEX_NAME = "download_time_ttl"
+
+def day_start(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def write_archive(path, records):
+    """Write records as gzip-compressed JSON lines (blocking - run in a thread)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+    os.replace(temp_path, path)
+
+class DownloadRetention:
+    """Keeps the downloads collection small: TTL expiry, daily summaries and raw archives"""
+    def __init__(self, downloads_col, summaries_col, retention_days=DOWNLOAD_RETENTION_DAYS, archive_path=DOWNLOAD_ARCHIVE_PATH):
+        self.downloads_col = downloads_col
+        self.summaries_col = summaries_col
+        self.retention_days = retention_days
+        self.archive_path = archive_path
+
+    async def ensure_indexes(self):
+        """Create (or update) the TTL index that expires old download records"""
+        expire_after = self.retention_days * 24 * 60 * 60
+        try:
+            await self.downloads_col.create_index("download_time", expireAfterSeconds=expire_after, name=TTL_INDEX_NAME)
+        except OperationFailure:
+            # The index exists with a different retention - change it in place
+            await self.downloads_col.database.command(
+                "collMod", self.downloads_col.name,
+                index={"name": TTL_INDEX_NAME, "expireAfterSeconds": expire_after}
+            )
+        await self.summaries_col.create_index("date")
+        log.info("retention_ready", retention_days=self.retention_days)
+
+    async def compact(self):
+        """Summarize and archive every finished day that hasn't been compacted yet"""
+        last_summary = await self.summaries_col.find_one({}, sort=[("date", -1)])
+        if last_summary:
+            day = last_summary['date'] + timedelta(days=1)
+        else:
+            oldest = await self.downloads_col.find_one({}, sort=[("download_time", 1)])
+            if not oldest:
+                return 0
+            day = day_start(oldest['download_time'])
+        
+        # Only whole days - today is still filling up
+        today = day_start(datetime.now())
+        compacted = 0
+        while day < today:
+            await self.compact_day(day)
+            day += timedelta(days=1)
+            compacted += 1
+        return compacted
+
+    async def compact_day(self, day):
+        """Archive one day's raw records, then roll them into a summary document"""
+        day_filter = {"download_time": {"$gte": day, "$lt": day + timedelta(days=1)}}
+        
+        # Step 1: Export raw records (the summary is only written once this succeeded)
+        records = await self.downloads_col.find(day_filter).to_list(length=None)
+        if records:
+            path = os.path.join(self.archive_path, f"downloads-{day.strftime('%Y-%m-%d')}.jsonl.gz")
+            await asyncio.to_thread(write_archive, path, records)
+        
+        # Step 2: Per format type and per user counts
+        pipeline = [
+            {"$match": day_filter},
+            {"$group": {"_id": {"user_id": "$user_id", "format_type": "$format_type"}, "count": {"$sum": 1}}},
+        ]
+        by_format_type = {}
+        by_user = {}
+        async for group in self.downloads_col.aggregate(pipeline):
+            format_type = group['_id'].get('format_type') or 'unknown'
+            user_id = group['_id'].get('user_id')
+            by_format_type[format_type] = by_format_type.get(format_type, 0) + group['count']
+            by_user[user_id] = by_user.get(user_id, 0) + group['count']
+        
+        await self.summaries_col.update_one(
+            {"date": day},
+            {"$set": {
+                "date": day,
+                "total": sum(by_format_type.values()),
+                "by_format_type": by_format_type,
+                "by_user": [{"user_id": user_id, "count": count} for user_id, count in by_user.items()],
+                "unique_users": len(by_user),
+                "compacted_at": datetime.now(),
+            }},
+            upsert=True
+        )
+        log.info("retention_day_compacted", day=day.strftime('%Y-%m-%d'), records=len(records), users=len(by_user))
+
+    async def _recent_filter(self):
+        """Filter for raw records not yet covered by a summary"""
+        last_summary = await self.summaries_col.find_one({}, sort=[("date", -1)])
+        if not last_summary:
+            return {}
+        return {"download_time": {"$gte": last_summary['date'] + timedelta(days=1)}}
+
+    async def total_downloads(self):
+        """All-time download count: summarized days plus raw records since"""
+        summarized = await self.summaries_col.aggregate([
+            {"$group": {"_id": None, "total": {"$sum": "$total"}}}
+        ]).to_list(length=1)
+        recent = await self.downloads_col.count_documents(await self._recent_filter())
+        return (summarized[0]['total'] if summarized else 0) + recent
+
+    async def format_type_counts(self):
+        """All-time downloads per format type, most popular first"""
+        counts = {}
+        async for summary in self.summaries_col.find({}, {"by_format_type": 1}):
+            for format_type, count in summary.get('by_format_type', {}).items():
+                counts[format_type] = counts.get(format_type, 0) + count
+        
+        pipeline = [
+            {"$match": await self._recent_filter()},
+            {"$group": {"_id": "$format_type", "count": {"$sum": 1}}},
+        ]
+        async for group in self.downloads_col.aggregate(pipeline):
+            format_type = group['_id'] or 'unknown'
+            counts[format_type] = counts.get(format_type, 0) + group['count']
+        
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)
+
+    async def run_periodically(self, interval=RETENTION_RUN_INTERVAL):
+        """Compact finished days on a schedule, well before the TTL expires them.
+        
+        The TTL index is only created once compaction has caught up, so on the first
+        run no record can expire before it has been archived and summarized.
+        """
+        indexed = False
+        while True:
+            try:
+                await self.compact()
+                if not indexed:
+                    await self.ensure_indexes()
+                    indexed = True
+            except Exception as e:
+                log.error("retention_error", error=str(e))
+            await asyncio.sleep(interval)
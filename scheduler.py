@@ -0,0 +1,58 @@
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from config import *
+
+class JobScheduler:
+    """Limit concurrent jobs, starting the job with the earliest predicted finish first"""
+    def __init__(self, max_jobs=MAX_CONCURRENT_JOBS):
+        self.max_jobs = max_jobs
+        self.running = 0
+        self.waiting = []  # Heap of (priority, seq, future)
+        self.counter = itertools.count()
+
+    def queue_length(self):
+        return sum(1 for _, _, fut in self.waiting if not fut.done())
+
+    def is_busy(self):
+        return self.running >= self.max_jobs
+
+    async def acquire(self, predicted_seconds=None):
+        """Wait for a free slot; short jobs jump ahead, but waiting time counts too"""
+        if self.running < self.max_jobs and not self.queue_length():
+            self.running += 1
+            return
+
+        # Priority is the predicted finish time if started now, so long jobs can't starve
+        priority = time.monotonic() + (predicted_seconds or 0)
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.counter), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as we were cancelled - pass it on
+                self.release()
+            raise
+
+    def release(self):
+        """Free a slot and hand it to the next waiting job"""
+        while self.waiting:
+            _, _, fut = heapq.heappop(self.waiting)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self, predicted_seconds=None):
+        await self.acquire(predicted_seconds)
+        try:
+            yield
+        finally:
+            self.release()
+
+# Shared scheduler instance
+scheduler = JobScheduler()
@@ -0,0 +1,138 @@
+import time
+import asyncio
+from pyrogram.errors import FloodWait
+from config import *
+from logs import *
+
+log = get_logger(__name__)
+
+class UploadSession:
+    """One Telegram client connection used for uploads"""
+    def __init__(self, name, client, primary=False):
+        self.name = name
+        self.client = client
+        self.primary = primary
+        self.active = 0
+        self.cooldown_until = 0
+        self.uploads = 0
+        self.failures = 0  # Consecutive non-FloodWait errors
+
+    def cooling_down(self):
+        return time.monotonic() < self.cooldown_until
+
+class UploadSessionPool:
+    """Spreads uploads over several Telegram sessions, least-loaded first.
+
+    The primary (bot) session sends files straight to the user. Extra upload
+    sessions send to UPLOAD_CHANNEL_ID and the primary copies the message to
+    the user, which needs no re-upload.
+    """
+    def __init__(self):
+        self.sessions = []
+
+    @property
+    def primary(self):
+        return next(session for session in self.sessions if session.primary)
+
+    def set_primary(self, client):
+        self.sessions.insert(0, UploadSession("primary", client, primary=True))
+
+    def add(self, name, client):
+        self.sessions.append(UploadSession(name, client))
+
+    async def start(self):
+        """Start the extra upload sessions (the primary is started by the bot)"""
+        for session in list(self.sessions):
+            if session.primary:
+                continue
+            try:
+                await session.client.start()
+                log.info("upload_session_ready", session=session.name)
+            except Exception as e:
+                log.error("upload_session_start_error", session=session.name, error=str(e))
+                self.sessions.remove(session)
+
+    async def stop(self):
+        for session in self.sessions:
+            if not session.primary:
+                try:
+                    await session.client.stop()
+                except Exception as e:
+                    log.error("upload_session_stop_error", session=session.name, error=str(e))
+
+    def cool_down(self, session, seconds):
+        """Take a session out of rotation after a FloodWait"""
+        session.cooldown_until = time.monotonic() + seconds
+        log.warning("upload_session_flood_wait", session=session.name, seconds=seconds)
+
+    def mark_failed(self, session, error):
+        """Take a broken session (revoked token, not admin in the channel...) out of rotation"""
+        session.failures += 1
+        seconds = min(UPLOAD_SESSION_ERROR_COOLDOWN * 2 ** (session.failures - 1), UPLOAD_SESSION_MAX_ERROR_COOLDOWN)
+        session.cooldown_until = time.monotonic() + seconds
+        log.error("upload_session_failed", session=session.name, failures=session.failures, seconds=seconds, error=str(error))
+
+    async def acquire(self):
+        """Pick the least-loaded session that isn't cooling down"""
+        while True:
+            ready = [session for session in self.sessions if not session.cooling_down()]
+            if ready:
+                # Prefer the primary on ties - it delivers without the extra copy step
+                return min(ready, key=lambda session: (session.active, not session.primary))
+            
+            # Every session is flood-waited - wait for the first one to come back
+            wait = min(session.cooldown_until for session in self.sessions) - time.monotonic()
+            if wait > UPLOAD_MAX_FLOOD_WAIT:
+                raise FloodWait(value=int(wait))
+            await asyncio.sleep(max(wait, 0))
+
+    async def deliver(self, chat_id, message_id):
+        """Copy an uploaded message from the upload channel to the user"""
+        for attempt in range(3):
+            try:
+                return await self.primary.client.copy_message(chat_id, UPLOAD_CHANNEL_ID, message_id)
+            except FloodWait as e:
+                # Copying is cheap, so wait it out rather than uploading again
+                if e.value > UPLOAD_MAX_FLOOD_WAIT:
+                    raise
+                await asyncio.sleep(e.value)
+        return await self.primary.client.copy_message(chat_id, UPLOAD_CHANNEL_ID, message_id)
+
+    async def send(self, chat_id, send):
+        """Upload with `send(client, chat_id)` on the best session and deliver to chat_id"""
+        for attempt in range(len(self.sessions) + 1):
+            session = await self.acquire()
+            session.active += 1
+            try:
+                if session.primary:
+                    message = await send(session.client, chat_id)
+                else:
+                    uploaded = await send(session.client, UPLOAD_CHANNEL_ID)
+            except FloodWait as e:
+                self.cool_down(session, e.value)
+                continue
+            except Exception as e:
+                # The primary's errors are about the file itself - another session won't do better
+                if session.primary:
+                    raise
+                self.mark_failed(session, e)
+                continue
+            finally:
+                session.active -= 1
+            
+            session.uploads += 1
+            session.failures = 0
+            if session.primary:
+                return message
+            
+            try:
+                return await self.deliver(chat_id, uploaded.id)
+            except FloodWait as e:
+                # Every copy goes through the primary, so uploading again elsewhere wouldn't help
+                self.cool_down(self.primary, e.value)
+                raise
+        
+        raise FloodWait(value=UPLOAD_MAX_FLOOD_WAIT)
+
+# Shared pool instance
+upload_pool = UploadSessionPool()
@@ -0,0 +1,68 @@
+"""A yt-dlp extractor that injects faults, so the resilience layer can be tested without YouTube"""
+import io
+import time
+import threading
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.networking.common import Response
+from yt_dlp.networking.exceptions import HTTPError
+from yt_dlp.utils import ExtractorError
+
+def http_error(status):
+    """The error yt-dlp raises when YouTube answers with an HTTP error status"""
+    response = Response(io.BytesIO(b''), 'https://www.youtube.com/watch?v=fake', {}, status=status)
+    return ExtractorError('Unable to download webpage', cause=HTTPError(response))
+
+def throttled():
+    return http_error(429)
+
+def server_error():
+    return http_error(503)
+
+def unavailable():
+    return ExtractorError('Private video. Sign in if you\'ve been granted access to this video', expected=True)
+
+class FaultScript:
+    """What the fake extractor does on each call: an exception to raise, or seconds to take.
+
+    Calls past the end of the script succeed immediately.
+    """
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.lock = threading.Lock()
+        self.calls = []  # (start, end, outcome) per call
+
+    def next_step(self):
+        with self.lock:
+            return self.steps.pop(0) if self.steps else 0
+
+    def record(self, start, outcome):
+        with self.lock:
+            self.calls.append((start, time.monotonic(), outcome))
+
+class FakeExtractorIE(InfoExtractor):
+    IE_NAME = 'FakeExtractor'
+    _VALID_URL = r'fake://(?P<id>\w+)'
+
+    def __init__(self, script, downloader=None):
+        super().__init__(downloader)
+        self.script = script
+
+    def _real_extract(self, url):
+        start = time.monotonic()
+        step = self.script.next_step()
+        if isinstance(step, Exception):
+            self.script.record(start, 'error')
+            raise step
+        time.sleep(step)
+        self.script.record(start, 'ok')
+        video_id = self._match_id(url)
+        return {'id': video_id, 'title': f'Fake video {video_id}', 'formats': [
+            {'format_id': '18', 'url': 'http://127.0.0.1/18.mp4', 'ext': 'mp4', 'height': 360},
+        ]}
+
+def fake_extract(script, video_id='video'):
+    """Blocking extraction through a real YoutubeDL with the fake extractor (run in a thread)"""
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        ydl.add_info_extractor(FakeExtractorIE(script))
+        return ydl.extract_info(f'fake://{video_id}', download=False, ie_key='FakeExtractor')
@@ -0,0 +1,78 @@
+"""Offline stand-ins for pyrogram clients, used to exercise UploadSessionPool without Telegram"""
+import asyncio
+import itertools
+from pyrogram.errors import FloodWait
+
+_message_ids = itertools.count(1)
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+class FakeMessage:
+    def __init__(self, chat_id, sender):
+        self.id = next(_message_ids)
+        self.chat = FakeChat(chat_id)
+        self.sender = sender
+
+class FakeClient:
+    """A client that "uploads" by sleeping, one upload at a time (its connection is the bottleneck).
+
+    upload_seconds: simulated time per upload on this session
+    flood_waits: FloodWait values raised by the next uploads, one per upload
+    error: raised by every upload (e.g. a bot that isn't admin in the channel)
+    copy_flood_waits: FloodWait values raised by the next copy_message calls
+    """
+    def __init__(self, name, upload_seconds=0.1, flood_waits=(), error=None, copy_flood_waits=()):
+        self.name = name
+        self.upload_seconds = upload_seconds
+        self.flood_waits = list(flood_waits)
+        self.error = error
+        self.copy_flood_waits = list(copy_flood_waits)
+        self.uploads = []  # chat IDs uploaded to
+        self.copies = []  # (to chat, from chat, message ID)
+        self.started = False
+        self.connection = asyncio.Lock()
+
+    async def start(self):
+        self.started = True
+
+    async def stop(self):
+        self.started = False
+
+    async def _upload(self, chat_id):
+        if self.error:
+            raise self.error
+        if self.flood_waits:
+            raise FloodWait(value=self.flood_waits.pop(0))
+        async with self.connection:
+            await asyncio.sleep(self.upload_seconds)
+        self.uploads.append(chat_id)
+        return FakeMessage(chat_id, self.name)
+
+    async def send_video(self, chat_id, video, **kwargs):
+        return await self._upload(chat_id)
+
+    async def send_audio(self, chat_id, audio, **kwargs):
+        return await self._upload(chat_id)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self._upload(chat_id)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        if self.copy_flood_waits:
+            raise FloodWait(value=self.copy_flood_waits.pop(0))
+        self.copies.append((chat_id, from_chat_id, message_id))
+        return FakeMessage(chat_id, self.name)
+
+def make_pool(primary, *uploaders):
+    """An UploadSessionPool over fake clients"""
+    from sessions import UploadSessionPool
+    pool = UploadSessionPool()
+    pool.set_primary(primary)
+    for client in uploaders:
+        pool.add(client.name, client)
+    return pool
+
+async def send_video(client, chat_id):
+    return await client.send_video(chat_id=chat_id, video="video.mp4")
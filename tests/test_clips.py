@@ -0,0 +1,22 @@
+from utils import *
+
+LINK = "https://youtu.be/abcdefghijk"
+
+def test_range_directly_after_link_is_a_clip():
+    assert extract_clip_ranges(f"{LINK} 1:20-1:50") == {"abcdefghijk": (80, 110)}
+    assert extract_clip_ranges(f"{LINK}\n1:02:03 - 1:05:00") == {"abcdefghijk": (3723, 3900)}
+
+def test_ranges_elsewhere_in_the_text_are_ignored():
+    assert extract_clip_ranges(f"{LINK} highlights 2019-2020") == {}
+    assert extract_clip_ranges(f"{LINK} episodes 3-4") == {}
+    assert extract_clip_ranges(f"1:20-1:50 {LINK}") == {}
+
+def test_each_link_gets_its_own_range():
+    text = f"{LINK} 1:20-1:50 https://www.youtube.com/watch?v=ABC-def_123 90-120 https://youtu.be/zzzzzzzzzzz"
+    assert extract_clip_ranges(text) == {"abcdefghijk": (80, 110), "ABC-def_123": (90, 120)}
+
+def test_parse_time_range():
+    assert parse_time_range(" 1:20-1:50 ") == (80, 110)
+    assert parse_time_range("1:50-1:20") is None
+    assert parse_time_range("1:75-2:00") is None
+    assert format_timestamp(3723) == "1:02:03"
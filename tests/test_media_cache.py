@@ -0,0 +1,92 @@
+import os
+import time
+import shutil
+import asyncio
+import subprocess
+import pytest
+import media_cache
+from media_cache import MediaCache
+
+needs_ffmpeg = pytest.mark.skipif(
+    not (shutil.which('ffmpeg') and shutil.which('ffprobe')), reason="ffmpeg/ffprobe not installed"
+)
+
+def make_cache(tmp_path, **options):
+    cache = MediaCache(path=f"{tmp_path}/cache/", **options)
+    cache.enabled = True
+    return cache
+
+@pytest.fixture
+def has_audio(monkeypatch):
+    # The fake files below are not real media - pretend ffprobe found an audio track
+    async def probe_audio(file_path):
+        return {"codec": "aac", "bit_rate": 0}
+    monkeypatch.setattr(media_cache, 'probe_audio', probe_audio)
+
+def write_file(path, size, age=0):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    if age:
+        os.utime(path, (time.time() - age, time.time() - age))
+    return str(path)
+
+def write_media(path, audio=True):
+    """A one second clip with a test pattern and, optionally, a sine tone"""
+    args = ['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=duration=1:size=64x64:rate=10']
+    if audio:
+        args += ['-f', 'lavfi', '-i', 'sine=duration=1', '-c:a', 'aac', '-b:a', '128k']
+    subprocess.run([*args, '-c:v', 'mpeg4', '-shortest', str(path)], check=True)
+    return str(path)
+
+def test_store_keeps_files_with_an_old_mtime(tmp_path, has_audio):
+    # yt-dlp can leave a file with the server's (old) Last-Modified time
+    cache = make_cache(tmp_path, ttl=3600)
+    source = write_file(tmp_path / "video.mp4", 100, age=10 ** 7)
+
+    cached = asyncio.run(cache.store("vid1", source))
+    os.remove(source)
+
+    assert cached and os.path.exists(cached)
+    cache.evict()
+    assert os.path.exists(cached)
+
+def test_expired_and_oversized_files_are_evicted(tmp_path, has_audio):
+    cache = make_cache(tmp_path, ttl=3600, max_bytes=250)
+    first = asyncio.run(cache.store("vid1", write_file(tmp_path / "a.mp4", 100)))
+    os.utime(first, (time.time() - 7200, time.time() - 7200))
+    second = asyncio.run(cache.store("vid2", write_file(tmp_path / "b.mp4", 100)))
+    os.utime(second, (time.time() - 60, time.time() - 60))
+    third = asyncio.run(cache.store("vid3", write_file(tmp_path / "c.mp4", 100)))
+    fourth = asyncio.run(cache.store("vid4", write_file(tmp_path / "d.mp4", 100)))
+
+    assert not os.path.exists(first)  # expired
+    assert not os.path.exists(second)  # oldest beyond the size limit
+    assert os.path.exists(third) and os.path.exists(fourth)
+
+def test_missing_cache_directory_finds_no_source(tmp_path):
+    cache = make_cache(tmp_path)
+    assert asyncio.run(cache.find_audio_source("gone", "aac", 128)) == (None, None)
+
+@needs_ffmpeg
+def test_video_without_audio_is_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    source = write_media(tmp_path / "silent.mp4", audio=False)
+
+    assert asyncio.run(cache.store("vid1", source)) is None
+    assert not os.path.exists(cache._video_dir("vid1"))
+
+@needs_ffmpeg
+@pytest.mark.parametrize("audio_ext, method, codec", [
+    ('m4a', "copy", 'aac'),
+    ('mp3', "transcode", 'mp3'),
+])
+def test_audio_is_derived_from_a_cached_video(tmp_path, audio_ext, method, codec):
+    cache = make_cache(tmp_path)
+    source = write_media(tmp_path / "video.mp4")
+    assert asyncio.run(cache.store("vid1", source))
+
+    file_path, source_path, used = asyncio.run(cache.derive_audio("vid1", audio_ext, 128, str(tmp_path / "audio")))
+
+    assert used == method
+    assert file_path == str(tmp_path / f"audio.{audio_ext}")
+    assert asyncio.run(media_cache.probe_audio(file_path))['codec'] == codec
@@ -0,0 +1,154 @@
+import time
+import asyncio
+import pytest
+import yt_dlp
+import resilience
+from resilience import *
+from fake_extractor import *
+
+@pytest.fixture(autouse=True)
+def fresh_resilience(monkeypatch):
+    """A fresh budget and breaker per test, and no real backoff sleeps"""
+    monkeypatch.setattr(resilience, 'retry_budget', RetryBudget())
+    monkeypatch.setattr(resilience, 'youtube_breaker', CircuitBreaker(threshold=3, cooldown=0.2))
+    monkeypatch.setattr(resilience, 'backoff_delay', lambda attempt: 0)
+    monkeypatch.setattr(resilience, 'BREAKER_POLL_INTERVAL', 0.01)
+
+def extract(script, video_id='video'):
+    return lambda: asyncio.to_thread(fake_extract, script, video_id)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_errors_are_classified():
+    for error, kind in ((throttled(), THROTTLED), (server_error(), RETRYABLE), (unavailable(), FATAL)):
+        script = FaultScript(error)
+        with pytest.raises(yt_dlp.utils.DownloadError) as raised:
+            fake_extract(script)
+        assert classify_error(raised.value) == kind
+
+def test_transient_errors_are_retried():
+    script = FaultScript(server_error(), server_error())
+    info = run(call_with_retries(extract(script), "extract"))
+    assert info['id'] == 'video'
+    assert [outcome for _, _, outcome in script.calls] == ['error', 'error', 'ok']
+
+def test_fatal_errors_are_not_retried():
+    script = FaultScript(unavailable())
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        run(call_with_retries(extract(script), "extract"))
+    assert len(script.calls) == 1
+    assert user_error_message(yt_dlp.utils.DownloadError('ERROR: Private video')) == '❌ This video is not available for download.'
+
+def test_retry_budget_limits_retries():
+    resilience.retry_budget.tokens = 0
+    resilience.retry_budget.ratio = 0
+    script = FaultScript(server_error(), server_error())
+    with pytest.raises(yt_dlp.utils.DownloadError):
+        run(call_with_retries(extract(script), "extract"))
+    assert len(script.calls) == 1
+
+def test_throttling_opens_breaker():
+    breaker = resilience.youtube_breaker
+    script = FaultScript(*(throttled() for _ in range(3)))
+    for _ in range(3):
+        with pytest.raises(yt_dlp.utils.DownloadError):
+            run(call_with_retries(extract(script), "extract", max_attempts=1))
+    assert breaker.state() == 'open' and breaker.is_open()
+    # Work doesn't go upstream while open
+    assert breaker.try_acquire() is False
+
+def open_breaker():
+    breaker = resilience.youtube_breaker
+    for _ in range(breaker.threshold):
+        breaker.record_throttle()
+    assert breaker.is_open()
+    return breaker
+
+def test_half_open_admits_a_single_probe():
+    breaker = open_breaker()
+    script = FaultScript(0.2)  # the probe is slow, the rest are quick
+
+    async def main():
+        await asyncio.sleep(breaker.cooldown)
+        return await asyncio.gather(*(call_with_retries(extract(script, f'v{i}'), "extract") for i in range(5)))
+
+    results = run(main())
+    assert len(results) == 5 and breaker.state() == 'closed'
+    probe_start, probe_end, _ = script.calls[0]
+    # Nobody else went upstream until the probe succeeded
+    assert all(start >= probe_end for start, _, _ in script.calls[1:])
+
+def test_deferred_work_stays_deferred_while_probe_is_out():
+    breaker = open_breaker()
+
+    async def main():
+        await asyncio.sleep(breaker.cooldown)
+        assert breaker.try_acquire() == 'probe'
+        assert breaker.is_open() and breaker.try_acquire() is False
+        waiter = asyncio.create_task(breaker.wait_until_closed())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        breaker.record_success()
+        await asyncio.wait_for(waiter, 1)
+
+    run(main())
+
+def test_throttled_probe_reopens_breaker_for_longer():
+    breaker = open_breaker()
+    script = FaultScript(throttled())
+
+    async def main():
+        await asyncio.sleep(breaker.cooldown)
+        with pytest.raises(yt_dlp.utils.DownloadError):
+            await call_with_retries(extract(script), "extract")
+
+    run(main())
+    assert breaker.state() == 'open' and breaker.cooldown == 0.4
+    assert not breaker.probing()
+
+def test_failed_probe_hands_over_to_next_call():
+    breaker = open_breaker()
+    script = FaultScript(unavailable())
+
+    async def main():
+        await asyncio.sleep(breaker.cooldown)
+        first = call_with_retries(extract(script, 'gone'), "extract")
+        second = call_with_retries(extract(script, 'fine'), "extract")
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = run(main())
+    assert isinstance(first, yt_dlp.utils.DownloadError)
+    assert second['id'] == 'fine' and breaker.state() == 'closed'
+
+def test_hedged_call_returns_the_faster_copy():
+    script = FaultScript(1.0, 0)
+
+    async def main():
+        start = time.monotonic()
+        info = await hedged(extract(script), delay=0.05)
+        return info, time.monotonic() - start
+
+    info, seconds = run(main())
+    assert info['id'] == 'video'
+    assert seconds < 0.5
+
+def test_successes_dont_hide_partial_throttling():
+    breaker = resilience.youtube_breaker
+    for _ in range(breaker.threshold):
+        breaker.record_throttle()
+        breaker.record_success()
+        if breaker.is_open():
+            break
+    assert breaker.state() == 'open'
+
+def test_retry_after_is_positive_while_probe_is_out():
+    breaker = open_breaker()
+
+    async def main():
+        await asyncio.sleep(breaker.cooldown)
+        assert breaker.retry_after() == 0
+        assert breaker.try_acquire() == 'probe'
+        assert breaker.is_open() and breaker.retry_after() > 0
+
+    run(main())
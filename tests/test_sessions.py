@@ -0,0 +1,79 @@
+import time
+import asyncio
+import pytest
+from pyrogram.errors import FloodWait
+from fake_sessions import *
+from config import *
+
+USER = 42
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def upload_many(pool, count):
+    start = time.monotonic()
+    messages = await asyncio.gather(*(pool.send(USER, send_video) for _ in range(count)))
+    return messages, time.monotonic() - start
+
+def test_throughput_scales_with_sessions():
+    single = make_pool(FakeClient("primary"))
+    _, single_seconds = run(upload_many(single, 8))
+
+    pooled = make_pool(FakeClient("primary"), *(FakeClient(f"uploader_{i}") for i in range(1, 4)))
+    messages, pooled_seconds = run(upload_many(pooled, 8))
+
+    assert all(message.chat.id == USER for message in messages)
+    assert single_seconds / pooled_seconds > 2.5
+    # Least-loaded assignment spreads the work evenly
+    assert sorted(session.uploads for session in pooled.sessions) == [2, 2, 2, 2]
+
+def test_flood_wait_moves_upload_to_another_session():
+    primary = FakeClient("primary", flood_waits=[30])
+    uploader = FakeClient("uploader_1")
+    pool = make_pool(primary, uploader)
+
+    message = run(pool.send(USER, send_video))
+
+    assert message.chat.id == USER
+    assert uploader.uploads == [UPLOAD_CHANNEL_ID]
+    assert pool.primary.cooling_down()
+
+def test_broken_session_fails_over_and_is_skipped():
+    primary = FakeClient("primary")
+    broken = FakeClient("uploader_1", error=RuntimeError("CHAT_ADMIN_REQUIRED"))
+    pool = make_pool(primary, broken)
+    # Make the broken session the least loaded one
+    pool.primary.active = 1
+
+    message = run(pool.send(USER, send_video))
+    assert message.chat.id == USER
+    assert primary.uploads == [USER]
+
+    broken_session = pool.sessions[1]
+    assert broken_session.cooling_down() and broken_session.failures == 1
+    run(pool.send(USER, send_video))
+    assert broken_session.failures == 1  # not tried again while cooling down
+
+def test_primary_error_is_not_retried_elsewhere():
+    primary = FakeClient("primary", error=RuntimeError("FILE_PARTS_INVALID"))
+    uploader = FakeClient("uploader_1")
+    pool = make_pool(primary, uploader)
+    uploader_session = pool.sessions[1]
+    uploader_session.active = 1
+
+    with pytest.raises(RuntimeError):
+        run(pool.send(USER, send_video))
+    assert not uploader.uploads
+
+def test_delivery_flood_wait_cools_primary_without_reuploading():
+    primary = FakeClient("primary", copy_flood_waits=[UPLOAD_MAX_FLOOD_WAIT + 60])
+    uploader = FakeClient("uploader_1")
+    pool = make_pool(primary, uploader)
+    pool.primary.active = 1
+
+    with pytest.raises(FloodWait):
+        run(pool.send(USER, send_video))
+
+    assert len(uploader.uploads) == 1
+    assert pool.primary.cooling_down()
+    assert not pool.sessions[1].cooling_down()
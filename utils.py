@@ -3,9 +3,20 @@ import asyncio
 import aiofiles
 from datetime import datetime
 import yt_dlp
+from pyrogram.errors import FloodWait
 import hashlib
 import re
+import time
 from config import *
+from jobs import *
+from predictor import *
+from ytdl_pool import *
+from sessions import *
+from media_cache import *
+from resilience import *
+from logs import *
+
+log = get_logger(__name__)
 
 # Create temp directory
 os.makedirs(TEMP_DOWNLOAD_PATH, exist_ok=True)
@@ -14,24 +25,50 @@ class ProgressHook:
     def __init__(self, progress_callback=None):
         self.progress_callback = progress_callback
         self.last_update = 0
+        self.cancelled = False
+        # Bytes and seconds spent actually transferring (no extraction, backoff or resumed bytes)
+        self.transfer_bytes = 0
+        self.transfer_seconds = 0.0
+        self.transfers = {}  # filename -> (downloaded_bytes, time) at its first progress event
+        # yt-dlp calls the hook from a worker thread, so callbacks are scheduled on this loop
+        self.loop = asyncio.get_running_loop()
+    
+    def _schedule(self, coro):
+        asyncio.run_coroutine_threadsafe(coro, self.loop)
     
     def __call__(self, d):
+        # Nobody is waiting for this download any more - make yt-dlp stop
+        if self.cancelled:
+            raise yt_dlp.utils.DownloadCancelled()
+        
         if d['status'] == 'downloading':
+            self.transfers.setdefault(d.get('filename'), (d.get('downloaded_bytes') or 0, time.monotonic()))
+            log.sampled(
+                "download_progress",
+                downloaded_bytes=d.get('downloaded_bytes'),
+                total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+                speed=d.get('speed'),
+                eta=d.get('eta'),
+            )
             if self.progress_callback and (datetime.now().timestamp() - self.last_update) > PROGRESS_UPDATE_INTERVAL:
                 try:
                     percent = d.get('_percent_str', '0%').replace('%', '')
                     speed = d.get('_speed_str', '0B/s')
                     eta = d.get('_eta_str', 'Unknown')
                     
-                    asyncio.create_task(
+                    self._schedule(
                         self.progress_callback(f"📥 **Downloading:** {percent}%\n⚡ **Speed:** {speed}\n⏰ **ETA:** {eta}")
                     )
                     self.last_update = datetime.now().timestamp()
                 except:
                     pass
         elif d['status'] == 'finished':
+            start = self.transfers.pop(d.get('filename'), None)
+            if start:
+                self.transfer_bytes += max((d.get('downloaded_bytes') or d.get('total_bytes') or 0) - start[0], 0)
+                self.transfer_seconds += time.monotonic() - start[1]
             if self.progress_callback:
-                asyncio.create_task(
+                self._schedule(
                     self.progress_callback("✅ **Download completed!**\n📤 **Sending file to your chat...**")
                 )
 
@@ -40,73 +77,99 @@ async def update_progress_message(message, text):
     try:
         await message.edit_text(text)
     except Exception as e:
-        print(f"Error updating progress: {e}")
+        log.warning("progress_update_error", error=str(e))
 
 def sanitize_filename(filename):
     """Sanitize filename for safe storage"""
     # Remove unsafe characters
     filename = re.sub(r'[<>:"/\\|?*]', '', filename)
     # Remove emojis and special characters
-    filename = re.sub(r'[^\w\s-.]', '', filename)
+    filename = re.sub(r'[^\w\s.-]', '', filename)
     # Limit length
     if len(filename) > 100:
         name, ext = os.path.splitext(filename)
         filename = name[:95] + ext
     return filename.strip()
 
-async def download_video(url, format_id, format_type, progress_callback, title):
-    """Download video/audio from YouTube"""
+def is_partial_file(filename):
+    """Check if a file is an unfinished yt-dlp download (.part, fragments, state files)"""
+    return filename.endswith(('.part', '.ytdl', '.temp')) or '.part-Frag' in filename
+
+def clip_params(clip):
+    """yt-dlp options that download only the (start, end) part of a video"""
+    start, end = clip
+    return {
+        'download_ranges': yt_dlp.utils.download_range_func(None, [(start, end)]),
+        # Off: stream copy, the cut snaps to the nearest keyframe. On: re-encode for exact cuts.
+        'force_keyframes_at_cuts': CLIP_FORCE_KEYFRAMES,
+    }
+
+def run_download(url, format_spec, outtmpl, progress_hook, **params):
+    """Download with a pooled YoutubeDL instance (blocking - run in a thread)"""
+    with ytdl_pool.instance('download', format=format_spec, outtmpl=outtmpl, progress_hook=progress_hook, **params) as ydl:
+        ydl.download([url])
+
+async def download_video(url, format_id, format_type, progress_callback, title, output_dir=TEMP_DOWNLOAD_PATH, clip=None, progress_hook=None):
+    """Download video/audio from YouTube (only the clip's time range, if given)"""
     try:
-        # Create progress hook
-        progress_hook = ProgressHook(progress_callback)
-        
-        # Configure yt-dlp options
-        ytdl_opts = get_ytdl_options(format_id, format_type == 'audio')
-        ytdl_opts['progress_hooks'] = [progress_hook]
+        # Create progress hook (callers pass their own to read the transfer stats)
+        progress_hook = progress_hook or ProgressHook(progress_callback)
         
         # Sanitize title for filename
         safe_title = sanitize_filename(title)
         
-        # Add format-specific options
+        # Format-specific options (everything else comes from the pooled 'download' profile)
+        if clip:
+            # The size limit applies to the clip, not the whole video
+            params = clip_params(clip)
+            size_filter = ''
+        else:
+            params = {}
+            size_filter = '[filesize<2G]'
         if format_type == 'audio':
-            ytdl_opts.update({
-                'format': f'{format_id}[filesize<2G]/bestaudio[filesize<2G]/best[filesize<2G]',
-                'extractaudio': True,
-                'audioformat': 'mp3',
-                'audioquality': '192K',
-                'outtmpl': f'{TEMP_DOWNLOAD_PATH}{safe_title}.%(ext)s'
-            })
+            format_spec = f'{format_id}{size_filter}/bestaudio{size_filter}/best{size_filter}'
         else:
-            ytdl_opts.update({
-                'format': f'{format_id}[filesize<2G]/best[filesize<2G]',
-                'outtmpl': f'{TEMP_DOWNLOAD_PATH}{safe_title}.%(ext)s'
-            })
-        
-        # Download
-        with yt_dlp.YoutubeDL(ytdl_opts) as ydl:
-            # Download the file
-            ydl.download([url])
-            
-            # Find downloaded file
-            for file in os.listdir(TEMP_DOWNLOAD_PATH):
-                if safe_title in file or any(word in file.lower() for word in safe_title.lower().split()[:3]):
-                    file_path = os.path.join(TEMP_DOWNLOAD_PATH, file)
-                    if os.path.getsize(file_path) > 100:  # File should be larger than 100 bytes
-                        return file_path
-            
-            # Fallback: get the latest file
-            files = [os.path.join(TEMP_DOWNLOAD_PATH, f) for f in os.listdir(TEMP_DOWNLOAD_PATH)]
-            if files:
-                latest_file = max(files, key=os.path.getctime)
-                if os.path.getsize(latest_file) > 100:
-                    return latest_file
+            format_spec = f'{format_id}{size_filter}/best{size_filter}'
+        outtmpl = f'{output_dir}{safe_title}.%(ext)s'
+        
+        async def on_retry(attempt, delay):
+            await progress_callback(f"🔁 **YouTube hiccup** - retrying in {int(delay) + 1}s...\n🎬 **{title}**")
+        
+        # Download in a worker thread so the bot keeps serving other users.
+        # Transient errors are retried; partial files are continued, not restarted.
+        try:
+            await call_with_retries(
+                lambda: asyncio.to_thread(run_download, url, format_spec, outtmpl, progress_hook, **params),
+                "download",
+                on_retry=on_retry
+            )
+        except asyncio.CancelledError:
+            progress_hook.cancelled = True
+            raise
+        
+        # Find downloaded file
+        for file in os.listdir(output_dir):
+            if is_partial_file(file):
+                continue
+            if safe_title in file or any(word in file.lower() for word in safe_title.lower().split()[:3]):
+                file_path = os.path.join(output_dir, file)
+                if os.path.getsize(file_path) > 100:  # File should be larger than 100 bytes
+                    return file_path
+        
+        # Fallback: get the latest file
+        files = [os.path.join(output_dir, f) for f in os.listdir(output_dir)
+                 if not is_partial_file(f) and os.path.isfile(os.path.join(output_dir, f))]
+        if files:
+            latest_file = max(files, key=os.path.getctime)
+            if os.path.getsize(latest_file) > 100:
+                return latest_file
                 
     except Exception as e:
-        print(f"Download error: {e}")
+        log.error("download_error", url=url, format_id=format_id, error=str(e))
         return None
 
 async def send_file_to_telegram(client, chat_id, file_path, title, format_type, progress_callback):
-    """Send file directly to Telegram chat"""
+    """Send file directly to Telegram chat, returning the sent message (False on failure)"""
     try:
         if not os.path.exists(file_path):
             return False
@@ -127,49 +190,66 @@ async def send_file_to_telegram(client, chat_id, file_path, title, format_type,
         filename = os.path.basename(file_path)
         file_size_mb = file_size / (1024 * 1024)
         
-        # Send file based on type and size
-        try:
-            if format_type == 'audio':
-                # Send as audio
-                await client.send_audio(
-                    chat_id=chat_id,
-                    audio=file_path,
-                    title=title,
-                    caption=f"🎵 **{title}**\n📁 **Size:** {file_size_mb:.1f} MB\n🎧 **Audio File**",
-                    thumb=None
-                )
-            else:
-                # Send as video
-                await client.send_video(
-                    chat_id=chat_id,
-                    video=file_path,
-                    caption=f"🎥 **{title}**\n📁 **Size:** {file_size_mb:.1f} MB\n🎬 **Video File**",
-                    supports_streaming=True,
-                    thumb=None
-                )
-            
-            return True
+        async def timed_upload(upload):
+            """Await one upload call and learn upload throughput from it if it succeeds.
             
-        except Exception as upload_error:
-            print(f"Upload error: {upload_error}")
-            
-            # Fallback: send as document
+            Only the transfer is timed - not FloodWait sleeps, failed attempts or the channel copy.
+            """
+            upload_start = time.monotonic()
+            message = await upload
+            await throughput.record(UPLOAD, file_size, time.monotonic() - upload_start)
+            return message
+        
+        # Send file based on type and size
+        async def send(client, chat_id):
             try:
-                await client.send_document(
+                if format_type == 'audio':
+                    # Send as audio
+                    return await timed_upload(client.send_audio(
+                        chat_id=chat_id,
+                        audio=file_path,
+                        title=title,
+                        caption=f"🎵 **{title}**\n📁 **Size:** {file_size_mb:.1f} MB\n🎧 **Audio File**",
+                        thumb=None
+                    ))
+                else:
+                    # Send as video
+                    return await timed_upload(client.send_video(
+                        chat_id=chat_id,
+                        video=file_path,
+                        caption=f"🎥 **{title}**\n📁 **Size:** {file_size_mb:.1f} MB\n🎬 **Video File**",
+                        supports_streaming=True,
+                        thumb=None
+                    ))
+                
+            except FloodWait:
+                # Let the session pool move the upload to another session
+                raise
+            except Exception as upload_error:
+                log.warning("upload_error", format_type=format_type, error=str(upload_error))
+                
+                # Fallback: send as document
+                return await timed_upload(client.send_document(
                     chat_id=chat_id,
                     document=file_path,
                     caption=f"📁 **{title}**\n📊 **Size:** {file_size_mb:.1f} MB\n🎯 **Downloaded File**",
                     file_name=filename
-                )
-                return True
-                
-            except Exception as doc_error:
-                print(f"Document upload error: {doc_error}")
-                await progress_callback(f"❌ **Upload failed:** {str(doc_error)}")
-                return False
+                ))
+        
+        # Upload on the least-loaded session
+        try:
+            if upload_pool.sessions:
+                return await upload_pool.send(chat_id, send)
+            else:
+                return await send(client, chat_id)
+            
+        except Exception as doc_error:
+            log.error("document_upload_error", error=str(doc_error))
+            await progress_callback(f"❌ **Upload failed:** {str(doc_error)}")
+            return False
             
     except Exception as e:
-        print(f"File send error: {e}")
+        log.error("file_send_error", error=str(e))
         await progress_callback(f"❌ **Error sending file:** {str(e)}")
         return False
     finally:
@@ -177,37 +257,127 @@ async def send_file_to_telegram(client, chat_id, file_path, title, format_type,
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                print(f"Cleaned up: {file_path}")
+                log.info("file_removed", file_path=file_path)
         except Exception as cleanup_error:
-            print(f"Cleanup error: {cleanup_error}")
+            log.error("file_cleanup_error", file_path=file_path, error=str(cleanup_error))
 
-async def process_download_and_send(client, url, format_id, format_type, progress_message, user_id, title):
-    """Main download and send processing function"""
+async def derive_local_audio(url, audio, output_dir, title, expected_size=0):
+    """Make the requested audio from a cached download of the same video, without YouTube"""
+    if not audio:
+        return None
+    video_id = extract_video_id(url)
+    derive_start = time.monotonic()
+    try:
+        result = await media_cache.derive_audio(
+            video_id, audio['ext'], audio.get('abr'), f"{output_dir}{sanitize_filename(title)}"
+        )
+        if not result:
+            return None
+        
+        file_path, source_path, method = result
+        size = os.path.getsize(file_path)
+    except Exception as e:
+        # Only a shortcut - fall back to downloading from YouTube
+        log.warning("audio_derivation_error", video_id=video_id, error=str(e))
+        return None
+    
+    # What we would have fetched upstream (the derived size if the estimate is unknown)
+    await media_cache.record_derivation(video_id, method, expected_size or size, size, time.monotonic() - derive_start)
+    return file_path
+
+async def process_download_and_send(client, url, format_id, format_type, progress_message, user_id, title, journal=None, job=None, clip=None, audio=None):
+    """Main download and send processing function, returns the sent message (False on failure)"""
     try:
         # Progress callback function
         async def progress_callback(text):
             await update_progress_message(progress_message, text)
         
-        # Step 1: Download
-        await progress_callback(f"📥 **Starting download...**\n🎬 **{title}**\n⏳ Initializing...")
-        
-        file_path = await download_video(url, format_id, format_type, progress_callback, title)
+        output_dir = job['scratch_dir'] if job else TEMP_DOWNLOAD_PATH
+        file_path = get_finished_file(job) if job else None
         
-        if not file_path or not os.path.exists(file_path):
-            await progress_callback("❌ **Download failed!** Please try again or choose different quality.")
-            return False
+        if file_path:
+            # Download finished before a restart - go straight to sending
+            await progress_callback(f"♻️ **Download already finished!**\n🎬 **{title}**\n📤 Sending file...")
+        else:
+            # Step 1: Download (partial files in the scratch directory are continued)
+            await progress_callback(f"📥 **Starting download...**\n🎬 **{title}**\n⏳ Initializing...")
+            
+            if job:
+                os.makedirs(output_dir, exist_ok=True)
+                await journal.transition(job, JOB_DOWNLOADING)
+            
+            # Audio of a video we still have locally doesn't need YouTube at all
+            file_path = None
+            if format_type == 'audio' and not clip:
+                file_path = await derive_local_audio(url, audio, output_dir, title, job.get('expected_size') if job else 0)
+            source = "local" if file_path else "youtube"
+            
+            if not file_path:
+                download_start = time.monotonic()
+                progress_hook = ProgressHook(progress_callback)
+                file_path = await download_video(
+                    url, format_id, format_type, progress_callback, title, output_dir, clip, progress_hook
+                )
+                download_seconds = time.monotonic() - download_start
+                log.info(
+                    "download_finished",
+                    format_id=format_id,
+                    format_type=format_type,
+                    clip=clip,
+                    ok=bool(file_path),
+                    size=os.path.getsize(file_path) if file_path and os.path.exists(file_path) else 0,
+                    duration_ms=int(download_seconds * 1000),
+                    transfer_bytes=progress_hook.transfer_bytes,
+                    transfer_ms=int(progress_hook.transfer_seconds * 1000),
+                )
+                
+                if not file_path or not os.path.exists(file_path):
+                    if job:
+                        await journal.transition(job, JOB_FAILED, error="download_failed")
+                    await progress_callback("❌ **Download failed!** Please try again or choose different quality.")
+                    return False
+                
+                # Learn from the transfer alone - extraction is in JOB_OVERHEAD_SECONDS and
+                # retry backoff or bytes resumed from an earlier run say nothing about speed
+                await throughput.record(DOWNLOAD, progress_hook.transfer_bytes, progress_hook.transfer_seconds)
+                
+                # Keep full downloads around so later audio requests can be served locally
+                if not clip:
+                    await media_cache.store(extract_video_id(url), file_path)
+            
+            if job:
+                await journal.transition(job, JOB_DOWNLOADED, file_path=file_path, source=source)
         
         # Step 2: Send file to Telegram
+        if job:
+            await journal.transition(job, JOB_UPLOADING)
+        
+        file_size = os.path.getsize(file_path)
+        upload_start = time.monotonic()
+        # The job's user can change while it runs (shared downloads), so read it now
+        chat_id = job['user_id'] if job else user_id
         success = await send_file_to_telegram(
-            client, user_id, file_path, title, format_type, progress_callback
+            client, chat_id, file_path, title, format_type, progress_callback
         )
         
+        upload_seconds = time.monotonic() - upload_start
+        # Upload throughput is learned inside send_file_to_telegram, from the transfer alone
+        log.info("upload_finished", ok=bool(success), size=file_size, duration_ms=int(upload_seconds * 1000))
+        
+        if job:
+            await journal.transition(job, JOB_DONE if success else JOB_FAILED)
+        
         return success
         
     except Exception as e:
-        await update_progress_message(progress_message, f"❌ **Error:** {str(e)}")
-        print(f"Process download error: {e}")
+        if job:
+            await journal.transition(job, JOB_FAILED, error=str(e))
+        await update_progress_message(progress_message, user_error_message(e))
+        log.error("process_download_error", error=str(e))
         return False
+    finally:
+        if job and job.get('state') in FINISHED_STATES:
+            remove_scratch_dir(job)
 
 def format_file_size(size_bytes):
     """Format file size in human readable format"""
@@ -220,12 +390,20 @@ def format_file_size(size_bytes):
         i += 1
     return f"{size_bytes:.1f}{size_names[i]}"
 
+# YouTube URL pattern, shared by the message filter and the ID helpers.
+# Path parts never cross whitespace so several links in one message match separately.
+YOUTUBE_URL_REGEX = re.compile(
+    r'(?:https?://)(?:www\.)?(?:youtube\.com/(?:[^/\s]+/\S+/|(?:v|e(?:mbed)?)/|\S*?[?&]v=)|youtu\.be/)([^"&?/\s]{11})'
+)
+
+# A time range like 1:20-1:50, 1:02:03-1:05:00 or 80-110 (standalone, never part of a link)
+TIME_RANGE_REGEX = re.compile(r'(?<!\S)(\d+(?::[0-5]?\d){0,2})\s*-\s*(\d+(?::[0-5]?\d){0,2})(?!\S)')
+# A time range directly after a link, separated only by whitespace
+CLIP_AFTER_LINK_REGEX = re.compile(r'\s+' + TIME_RANGE_REGEX.pattern)
+
 def validate_youtube_url(url):
     """Validate if URL is a valid YouTube URL"""
-    youtube_regex = re.compile(
-        r'(?:https?://)(?:www\.)?(?:youtube\.com/(?:[^/]+/.+/|(?:v|e(?:mbed)?)/|.*[?&]v=)|youtu\.be/)([^"&?/\s]{11})'
-    )
-    return bool(youtube_regex.match(url))
+    return bool(YOUTUBE_URL_REGEX.match(url))
 
 async def cleanup_temp_files():
     """Clean up old temporary files"""
@@ -243,98 +421,164 @@ async def cleanup_temp_files():
                 if (current_time - file_time).total_seconds() > 1800:
                     try:
                         os.remove(file_path)
-                        print(f"Cleaned up temp file: {filename}")
+                        log.info("temp_file_removed", filename=filename)
                     except:
                         pass
+        
+        # Delete scratch directories of jobs too old to ever be resumed
+        if os.path.exists(JOB_SCRATCH_PATH):
+            for job_id in os.listdir(JOB_SCRATCH_PATH):
+                scratch_dir = os.path.join(JOB_SCRATCH_PATH, job_id)
+                dir_time = datetime.fromtimestamp(os.path.getmtime(scratch_dir))
+                if os.path.isdir(scratch_dir) and (current_time - dir_time).total_seconds() > JOB_RESUME_MAX_AGE:
+                    remove_scratch_dir({'scratch_dir': scratch_dir})
     except Exception as e:
-        print(f"Cleanup error: {e}")
+        log.error("temp_cleanup_error", error=str(e))
+
+def extract_info_sync(url):
+    """Extract full video info with a pooled YoutubeDL instance (blocking)"""
+    with log.timed("extract", url=url), ytdl_pool.instance('info') as ydl:
+        return ydl.extract_info(url, download=False)
+
+async def extract_info(url):
+    """Extract full video info without blocking the event loop, retrying transient errors"""
+    async def extract():
+        return await asyncio.to_thread(extract_info_sync, url)
+    
+    if HEDGE_EXTRACTION:
+        return await call_with_retries(lambda: hedged(extract), "extract")
+    return await call_with_retries(extract, "extract")
 
 def get_video_info(url):
     """Extract basic video information"""
     try:
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Unknown'),
-                'duration': info.get('duration', 0),
-                'thumbnail': info.get('thumbnail', ''),
-                'uploader': info.get('uploader', 'Unknown'),
-                'view_count': info.get('view_count', 0),
-                'upload_date': info.get('upload_date', ''),
-            }
+        info = extract_info_sync(url)
+        return {
+            'title': info.get('title', 'Unknown'),
+            'duration': info.get('duration', 0),
+            'thumbnail': info.get('thumbnail', ''),
+            'uploader': info.get('uploader', 'Unknown'),
+            'view_count': info.get('view_count', 0),
+            'upload_date': info.get('upload_date', ''),
+        }
     except Exception as e:
-        print(f"Info extraction error: {e}")
+        log.error("info_extraction_error", url=url, error=str(e))
         return None
 
 def extract_video_id(url):
     """Extract video ID from YouTube URL"""
     try:
-        youtube_regex = re.compile(
-            r'(?:https?://)(?:www\.)?(?:youtube\.com/(?:[^/]+/.+/|(?:v|e(?:mbed)?)/|.*[?&]v=)|youtu\.be/)([^"&?/\s]{11})'
-        )
-        match = youtube_regex.search(url)
+        match = YOUTUBE_URL_REGEX.search(url)
         return match.group(1) if match else None
     except:
         return None
 
+def extract_video_ids(text):
+    """Extract all unique video IDs from a message, in order"""
+    video_ids = []
+    for match in YOUTUBE_URL_REGEX.finditer(text or ''):
+        if match.group(1) not in video_ids:
+            video_ids.append(match.group(1))
+    return video_ids
+
+def parse_timestamp(text):
+    """Convert '90', '1:30' or '1:01:30' to seconds"""
+    seconds = 0
+    for part in text.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def format_timestamp(seconds):
+    """Format seconds as m:ss or h:mm:ss"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def time_range_from_match(match):
+    """(start, end) in seconds from a TIME_RANGE_REGEX match, or None if it ends before it starts"""
+    start, end = parse_timestamp(match.group(1)), parse_timestamp(match.group(2))
+    return (start, end) if end > start else None
+
+def parse_time_range(text):
+    """Parse a text that is just a 'start-end' time range, e.g. '1:20-1:50' -> (80, 110)"""
+    match = TIME_RANGE_REGEX.fullmatch((text or '').strip())
+    return time_range_from_match(match) if match else None
+
+def extract_clip_ranges(text):
+    """Map video IDs to the time range written right after their link, e.g. 'url 1:20-1:50'"""
+    text = text or ''
+    clips = {}
+    for match in YOUTUBE_URL_REGEX.finditer(text):
+        # Only a range directly after the link counts - '2019-2020' later in the text is not a clip
+        range_match = CLIP_AFTER_LINK_REGEX.match(text, match.end())
+        clip = time_range_from_match(range_match) if range_match else None
+        if clip and match.group(1) not in clips:
+            clips[match.group(1)] = clip
+    return clips
+
+def video_url(video_id):
+    """Build a canonical YouTube URL from a video ID"""
+    return f"https://www.youtube.com/watch?v={video_id}"
+
 async def get_video_formats(url):
     """Get available video formats with file size filtering"""
     try:
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            formats = info.get('formats', [])
-            
-            video_formats = []
-            audio_formats = []
-            
-            # Process video formats
-            for f in formats:
-                if f.get('vcodec') != 'none' and f.get('height'):
-                    height = f.get('height')
-                    fps = f.get('fps', 30)
-                    filesize = f.get('filesize', 0)
-                    
-                    # Skip files larger than 2GB
-                    if filesize and filesize > MAX_FILE_SIZE:
-                        continue
-                        
-                    if height >= 240:
-                        format_note = f"{height}p{fps}" if fps > 30 else f"{height}p"
-                        if not any(vf[1].split('(')[0].strip() == format_note for vf in video_formats):
-                            video_formats.append((
-                                f['format_id'], 
-                                format_note, 
-                                filesize,
-                                f.get('ext', 'mp4')
-                            ))
-            
-            # Process audio formats
-            for f in formats:
-                if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
-                    ext = f.get('ext', 'unknown')
-                    abr = f.get('abr', 128)
-                    filesize = f.get('filesize', 0)
+        info = await extract_info(url)
+        formats = info.get('formats', [])
+        duration = info.get('duration') or 0
+        
+        video_formats = []
+        audio_formats = []
+        
+        # Process video formats
+        for f in formats:
+            if f.get('vcodec') != 'none' and f.get('height'):
+                height = f.get('height')
+                fps = f.get('fps', 30)
+                filesize = estimate_format_size(f, duration)
+                
+                # Skip files larger than 2GB
+                if filesize and filesize > MAX_FILE_SIZE:
+                    continue
                     
-                    # Skip files larger than 2GB
-                    if filesize and filesize > MAX_FILE_SIZE:
-                        continue
-                        
-                    if ext in ['mp3', 'm4a', 'opus', 'aac']:
-                        audio_formats.append((
+                if height >= 240:
+                    format_note = f"{height}p{fps}" if fps > 30 else f"{height}p"
+                    if not any(vf[1].split('(')[0].strip() == format_note for vf in video_formats):
+                        video_formats.append((
                             f['format_id'], 
-                            f"{ext.upper()} {int(abr)}kbps", 
+                            format_note, 
                             filesize,
-                            ext
+                            f.get('ext', 'mp4')
                         ))
-            
-            # Sort formats
-            video_formats.sort(key=lambda x: int(x[1].split('p')[0]), reverse=True)
-            audio_formats.sort(key=lambda x: int(re.search(r'(\d+)', x[1]).group(1)) if re.search(r'(\d+)', x[1]) else 0, reverse=True)
-            
-            return video_formats, audio_formats
-            
+        
+        # Process audio formats
+        for f in formats:
+            if f.get('acodec') != 'none' and f.get('vcodec') == 'none':
+                ext = f.get('ext', 'unknown')
+                abr = f.get('abr', 128)
+                filesize = estimate_format_size(f, duration)
+                
+                # Skip files larger than 2GB
+                if filesize and filesize > MAX_FILE_SIZE:
+                    continue
+                    
+                if ext in ['mp3', 'm4a', 'opus', 'aac']:
+                    audio_formats.append((
+                        f['format_id'], 
+                        f"{ext.upper()} {int(abr)}kbps", 
+                        filesize,
+                        ext
+                    ))
+        
+        # Sort formats
+        video_formats.sort(key=lambda x: int(x[1].split('p')[0]), reverse=True)
+        audio_formats.sort(key=lambda x: int(re.search(r'(\d+)', x[1]).group(1)) if re.search(r'(\d+)', x[1]) else 0, reverse=True)
+        
+        return video_formats, audio_formats
+        
     except Exception as e:
-        print(f"Format extraction error: {e}")
+        log.error("format_extraction_error", url=url, error=str(e))
         return [], []
 
 def is_valid_format(format_id, available_formats):
@@ -344,22 +588,18 @@ def is_valid_format(format_id, available_formats):
     except:
         return False
 
-async def estimate_download_time(file_size, avg_speed_mbps=10):
-    """Estimate download time based on file size"""
+async def estimate_download_time(file_size, avg_speed_mbps=None):
+    """Estimate download time based on file size and learned throughput"""
     try:
         if file_size <= 0:
             return "Unknown"
         
-        # Convert to MB and estimate time
-        size_mb = file_size / (1024 * 1024)
-        time_seconds = size_mb / avg_speed_mbps
-        
-        if time_seconds < 60:
-            return f"{int(time_seconds)}s"
-        elif time_seconds < 3600:
-            return f"{int(time_seconds/60)}m {int(time_seconds%60)}s"
+        if avg_speed_mbps:
+            time_seconds = file_size / (avg_speed_mbps * 1024 * 1024)
         else:
-            return f"{int(time_seconds/3600)}h {int((time_seconds%3600)/60)}m"
+            time_seconds = throughput.predict_download_seconds(file_size)
+        
+        return format_eta(time_seconds)
             
     except:
         return "Unknown"
@@ -381,9 +621,9 @@ def create_temp_directory():
     """Ensure temp directory exists"""
     try:
         os.makedirs(TEMP_DOWNLOAD_PATH, exist_ok=True)
-        print(f"✅ Temp directory ready: {TEMP_DOWNLOAD_PATH}")
+        log.info("temp_directory_ready", path=TEMP_DOWNLOAD_PATH)
     except Exception as e:
-        print(f"❌ Error creating temp directory: {e}")
+        log.error("temp_directory_error", path=TEMP_DOWNLOAD_PATH, error=str(e))
 
 # Run cleanup periodically
 async def periodic_cleanup():
@@ -392,8 +632,10 @@ async def periodic_cleanup():
         try:
             await asyncio.sleep(1800)  # 30 minutes
             await cleanup_temp_files()
+            await asyncio.to_thread(media_cache.evict)
+            await asyncio.to_thread(ytdl_pool.recycle)
         except Exception as e:
-            print(f"Periodic cleanup error: {e}")
+            log.error("periodic_cleanup_error", error=str(e))
 
 # Initialize on import
 create_temp_directory()
@@ -0,0 +1,118 @@
+import time
+import threading
+from contextlib import contextmanager
+import yt_dlp
+from config import *
+from logs import *
+
+log = get_logger(__name__)
+
+# Option profiles the pool keeps warm instances for
+YTDL_PROFILES = {
+    'info': YTDL_INFO_OPTIONS,
+    'download': get_ytdl_options(),
+}
+
+class PooledYoutubeDL:
+    """A long-lived YoutubeDL instance that is re-targeted for each request"""
+    def __init__(self, options):
+        self.ydl = yt_dlp.YoutubeDL(dict(options))
+        self.base_params = dict(self.ydl.params)
+        self.base_outtmpl = dict(self.ydl.params['outtmpl'])
+        self.base_format_selector = self.ydl.format_selector
+        self.progress_hook = None
+        self.ydl.add_progress_hook(self._on_progress)
+        self.created = time.monotonic()
+        self.uses = 0
+        
+        # Load the YouTube extractor now instead of on the first request
+        self.ydl.get_info_extractor('Youtube')
+
+    def _on_progress(self, d):
+        if self.progress_hook:
+            self.progress_hook(d)
+
+    def configure(self, format=None, outtmpl=None, progress_hook=None, **params):
+        """Apply per-request options and return the YoutubeDL instance"""
+        self.ydl.params.update(params)
+        if format:
+            self.ydl.params['format'] = format
+            self.ydl.format_selector = self.ydl.build_format_selector(format)
+        if outtmpl:
+            self.ydl.params['outtmpl'] = dict(self.base_outtmpl, default=outtmpl)
+        self.progress_hook = progress_hook
+        return self.ydl
+
+    def reset(self):
+        """Undo per-request options so the next request starts clean"""
+        self.ydl.params.clear()
+        self.ydl.params.update(self.base_params)
+        self.ydl.params['outtmpl'] = dict(self.base_outtmpl)
+        self.ydl.format_selector = self.base_format_selector
+        self.progress_hook = None
+        self.uses += 1
+
+    def expired(self):
+        return self.uses >= YTDL_POOL_MAX_USES or (time.monotonic() - self.created) > YTDL_POOL_MAX_AGE
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception as e:
+            log.error("ytdl_close_error", error=str(e))
+
+class YoutubeDLPool:
+    """Thread-safe pool of pre-initialised YoutubeDL instances, keyed by option profile"""
+    def __init__(self, profiles=YTDL_PROFILES, size=YTDL_POOL_SIZE):
+        self.profiles = profiles
+        self.size = size
+        self.idle = {profile: [] for profile in profiles}
+        self.lock = threading.Lock()
+
+    def checkout(self, profile):
+        """Take an idle instance, or create one if the pool is empty"""
+        with self.lock:
+            idle = self.idle[profile]
+            entry = idle.pop() if idle else None
+        return entry or PooledYoutubeDL(self.profiles[profile])
+
+    def checkin(self, profile, entry):
+        """Return an instance to the pool, closing it if it's worn out or surplus"""
+        entry.reset()
+        if not entry.expired():
+            with self.lock:
+                if len(self.idle[profile]) < self.size:
+                    self.idle[profile].append(entry)
+                    return
+        entry.close()
+
+    @contextmanager
+    def instance(self, profile, **options):
+        """Borrow a YoutubeDL instance configured with per-request options"""
+        entry = self.checkout(profile)
+        try:
+            yield entry.configure(**options)
+        finally:
+            self.checkin(profile, entry)
+
+    def prewarm(self, count=YTDL_POOL_PREWARM):
+        """Create instances ahead of the first requests (blocking - run in a thread)"""
+        for profile, options in self.profiles.items():
+            entries = [PooledYoutubeDL(options) for _ in range(min(count, self.size))]
+            with self.lock:
+                self.idle[profile].extend(entries)
+        log.info("ytdl_pool_ready", profiles=list(self.profiles), per_profile=min(count, self.size))
+
+    def recycle(self):
+        """Close idle instances that have been in use too long"""
+        with self.lock:
+            expired = []
+            for profile, idle in self.idle.items():
+                expired += [entry for entry in idle if entry.expired()]
+                idle[:] = [entry for entry in idle if not entry.expired()]
+        for entry in expired:
+            entry.close()
+        return len(expired)
+
+# Shared pool instance
+ytdl_pool = YoutubeDLPool()